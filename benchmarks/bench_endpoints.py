@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Load test the app endpoints against synthetic glossaries.
+
+For each glossary size it creates (or reuses) a local sqlite db, sends
+requests through the flask test client, with term popularity following a
+Zipf distribution, and measures the throughput and the p50/p99 latencies of
+each endpoint. Results are written to a json file so runs can be compared.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/bench_endpoints.py --terms 10000 100000`.
+"""
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from glossary import ZipfSampler, populate, term_names
+
+from wm_what import lib
+from wm_what.app import app
+
+BENCH_USER = "benchuser"
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def measure(send_request: Callable[[int], Any], num_requests: int) -> Dict[str, Any]:
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    for request_number in range(num_requests):
+        request_start = time.perf_counter()
+        response = send_request(request_number)
+        latencies.append(time.perf_counter() - request_start)
+        if response.status_code >= 400:
+            errors += 1
+
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": num_requests,
+        "errors": errors,
+        "throughput_rps": num_requests / total,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench_glossary(num_terms: int, num_requests: int, db_path: Path, seed: int) -> Dict[str, Dict[str, Any]]:
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    if not db_path.exists():
+        print(f"Generating {num_terms} terms in {db_path}")
+        populate(app=app, num_terms=num_terms, seed=seed)
+    lib.clear_caches()
+
+    names = term_names(num_terms=num_terms, seed=seed)
+    rng = random.Random(seed)
+    popularity = ZipfSampler(maximum=len(names), exponent=1.0, rng=rng)
+
+    def popular_name() -> str:
+        return names[popularity.sample() - 1]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = BENCH_USER
+        session["username"] = BENCH_USER
+        session["_fresh"] = True
+
+    # a definition of the bench user to update
+    client.post("/definition", data={"term_name": names[0], "content": "Benchmark definition"})
+    with app.app_context():
+        definition_id = lib.get_definitions_page(limit=1, author=BENCH_USER)[0][0]["id"]
+
+    run_id = int(time.time())
+    scenarios: Dict[str, Callable[[int], Any]] = {
+        "GET /": lambda _: client.get("/"),
+        "GET /search": lambda _: client.get("/search", query_string={"term_name": popular_name()[:3]}),
+        "GET /term/<name>": lambda _: client.get(f"/term/{popular_name()}"),
+        "GET /api/v1/terms": lambda _: client.get("/api/v1/terms"),
+        "GET /api/v1/terms/<name>": lambda _: client.get(f"/api/v1/terms/{popular_name()}"),
+        "POST /term": lambda number: client.post(
+            "/term", data={"term_name": f"bench_{run_id}_{number}", "content": "Benchmark term"}
+        ),
+        "POST /definition": lambda number: client.post(
+            "/definition", data={"term_name": popular_name(), "content": f"Benchmark definition {number}"}
+        ),
+        "POST /definition/<id>": lambda number: client.post(
+            f"/definition/{definition_id}", data={"term_name": names[0], "content": f"Updated {number}"}
+        ),
+        "POST /api/v1/import": lambda number: client.post(
+            "/api/v1/import",
+            json=[
+                {"name": f"import_{run_id}_{number}_{row}", "definitions": [{"content": "Benchmark import"}]}
+                for row in range(100)
+            ],
+        ),
+    }
+
+    results = {}
+    for name, send_request in scenarios.items():
+        results[name] = measure(send_request=send_request, num_requests=num_requests)
+        print(
+            f"{num_terms:>8} {name:<28} {results[name]['throughput_rps']:>9.1f} req/s "
+            f"p50 {results[name]['p50_ms']:>8.2f}ms p99 {results[name]['p99_ms']:>8.2f}ms"
+        )
+
+    return results
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, nargs="+", default=[10000], help="Glossary sizes to test with.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--db-dir",
+        type=Path,
+        default=Path(tempfile.gettempdir()),
+        help="Where to keep the generated dbs, they are reused if they exist, writes included.",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Disable the lib caches.")
+    parser.add_argument("--output", type=Path, help="Json file to write the results to.")
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_ECHO"] = False
+    if args.no_cache:
+        lib.configure_caches(maxsize=0)
+
+    started = datetime.now()
+    results = {
+        "started": started.isoformat(),
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "requests_per_endpoint": args.requests,
+        "cache": not args.no_cache,
+        "glossaries": {},
+    }
+    for num_terms in args.terms:
+        db_path = args.db_dir / f"wm-what-bench-{num_terms}-{args.seed}.db"
+        results["glossaries"][num_terms] = bench_glossary(
+            num_terms=num_terms, num_requests=args.requests, db_path=db_path, seed=args.seed
+        )
+
+    output = args.output or RESULTS_DIR / f"endpoints-{started:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=4))
+    print(f"Results written to {output}")
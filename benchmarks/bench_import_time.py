@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Measure the cold start of the app, what every new worker pays.
+
+Runs fresh interpreters with `python -X importtime` to time importing the
+wm_what.app module, then creating the app, and serving the first api docs
+request (that sets up flasgger), and lists the slowest imports.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/bench_import_time.py`.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+REPO_FOLDER = Path(__file__).resolve().parent.parent
+STAGES = {
+    "import wm_what.app": "import wm_what.app",
+    "create the app": "from wm_what.app import app",
+    "first /apispec_1.json": "from wm_what.app import app; app.test_client().get('/apispec_1.json')",
+}
+TIMER = "import time as _time; _start = _time.perf_counter(); {code}; print(_time.perf_counter() - _start)"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_stage(code: str) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """Return the wall time of the code in seconds and the (self us, cumulative us, module) imported."""
+    env = dict(os.environ, PYTHONPATH=str(REPO_FOLDER))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", TIMER.format(code=code)],
+        cwd=REPO_FOLDER,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            imports.append((int(match.group(1)), int(match.group(2)), match.group(4)))
+
+    return float(result.stdout.strip().splitlines()[-1]), imports
+
+
+def get_top_level_imports(imports: List[Tuple[int, int, str]]) -> Dict[str, int]:
+    # the nested imports are listed before the module importing them, with more indentation,
+    # so the cumulative time of the packages imported directly is enough
+    return {module: cumulative for _, cumulative, module in imports if "." not in module}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Interpreters to start per stage.")
+    parser.add_argument("--top", type=int, default=15, help="Slowest top level imports to show.")
+    args = parser.parse_args()
+
+    for stage, code in STAGES.items():
+        runs = [run_stage(code) for _ in range(args.runs)]
+        wall_times = [wall_time for wall_time, _ in runs]
+        _, imports = runs[-1]
+        # the minimum is the least affected by the noise of other processes
+        print(
+            f"{stage:<24} {min(wall_times) * 1000:>8.1f}ms "
+            f"(median {statistics.median(wall_times) * 1000:.1f}ms, {len(imports)} modules imported)"
+        )
+
+    _, imports = run_stage(STAGES["create the app"])
+    print("\nSlowest top level imports when creating the app (cumulative):")
+    top_level_imports = sorted(get_top_level_imports(imports).items(), key=lambda item: item[1], reverse=True)
+    for module, cumulative in top_level_imports[: args.top]:
+        print(f"  {cumulative / 1000:>8.1f}ms {module}")
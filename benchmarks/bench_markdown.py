@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of rendering term pages with and without the markdown cache.
+
+Run from the repo root with `FLASK_ENV=development python benchmarks/bench_markdown.py`.
+"""
+import argparse
+import timeit
+from datetime import datetime
+
+from flask import render_template
+
+from wm_what.app import app
+from wm_what.rendering import rendered_cache
+
+CONTENT = "Some **bold** text, a [link](https://wikitech.wikimedia.org/wiki/Help:Cloud_Services) and `code` #{number}"
+
+
+def make_term(num_definitions: int):
+    now = datetime.now().isoformat()
+    return {
+        "name": "bench",
+        "definitions": [
+            {
+                "id": number,
+                "author": "bench",
+                "content": CONTENT.format(number=number),
+                "created": now,
+                "updated": now,
+            }
+            for number in range(num_definitions)
+        ],
+    }
+
+
+def render(term) -> str:
+    return render_template("term.html", term=term, has_definition=True, user=None)
+
+
+def render_uncached(term) -> str:
+    rendered_cache.clear()
+    return render(term)
+
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("--definitions", type=int, nargs="+", default=[1, 10, 100, 1000])
+parser.add_argument("--repeat", type=int, default=20)
+args = parser.parse_args()
+
+with app.test_request_context():
+    print(f"{'definitions':>12} {'uncached (ms)':>14} {'cached (ms)':>12} {'speedup':>8}")
+    for num_definitions in args.definitions:
+        term = make_term(num_definitions=num_definitions)
+        rendered_cache.configure(maxsize=max(num_definitions, rendered_cache.maxsize), ttl=None)
+        uncached = min(timeit.repeat(lambda: render_uncached(term), number=1, repeat=args.repeat)) * 1000
+        render(term)
+        cached = min(timeit.repeat(lambda: render(term), number=1, repeat=args.repeat)) * 1000
+        print(f"{num_definitions:>12} {uncached:>14.2f} {cached:>12.2f} {uncached / cached:>7.1f}x")
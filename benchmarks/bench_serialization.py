@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Measure the cost of loading and encoding full listings of terms, the old way and the fast way.
+
+For each glossary size it compares loading all the terms as ORM instances
+and dumping them with TermSchema, with dumping them from the rows of a Core
+select with wm_what.serializers, and encoding the result to JSON with the
+Flask default provider and with wm_what.fastjson (orjson, when installed). The
+best of --repeat runs is reported.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/bench_serialization.py --terms 1000 10000 100000`.
+"""
+import argparse
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from flask.json.provider import DefaultJSONProvider
+from glossary import populate
+from sqlalchemy.orm import selectinload
+
+from wm_what import fastjson, serializers
+from wm_what.app import app
+from wm_what.models import Term, TermSchema, db
+
+
+def load_with_schema() -> List[Dict[str, Any]]:
+    terms = db.session.query(Term).options(selectinload(Term.definitions)).order_by(Term.name).all()
+    return TermSchema(many=True).dump(terms)
+
+
+def load_with_serializers() -> List[Dict[str, Any]]:
+    return list(serializers.dump_terms(db.session.execute(serializers.select_terms())))
+
+
+def encode_with(provider_class: type, data: Any) -> Callable[[], str]:
+    provider = provider_class(app)
+    return lambda: provider.dumps(data, separators=(",", ":"))
+
+
+def best_ms(function: Callable[[], Any], repeat: int) -> float:
+    def _run() -> None:
+        # nothing kept between runs, as in separate requests
+        db.session.expunge_all()
+        function()
+
+    return min(timeit.repeat(_run, number=1, repeat=repeat)) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, nargs="+", default=[1000, 10000, 100000], help="Glossary sizes.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--db-dir",
+        type=Path,
+        default=Path(tempfile.gettempdir()),
+        help="Where to keep the generated dbs, they are reused if they exist.",
+    )
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_ECHO"] = False
+    app.debug = False
+    if fastjson.orjson is None:
+        print("orjson is not installed, the fast encoding falls back to the stdlib one.\n")
+
+    print(
+        f"{'terms':>8} {'schema (ms)':>12} {'rows (ms)':>10} {'speedup':>8} "
+        f"{'stdlib json (ms)':>17} {'fast json (ms)':>15} {'speedup':>8}"
+    )
+    for num_terms in args.terms:
+        db_path = args.db_dir / f"wm-what-bench-{num_terms}-{args.seed}.db"
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+        if not db_path.exists():
+            populate(app=app, num_terms=num_terms, seed=args.seed)
+
+        with app.test_request_context():
+            schema = best_ms(load_with_schema, repeat=args.repeat)
+            rows = best_ms(load_with_serializers, repeat=args.repeat)
+            terms = load_with_serializers()
+            stdlib_json = best_ms(encode_with(DefaultJSONProvider, terms), repeat=args.repeat)
+            fast_json = best_ms(encode_with(fastjson.FastJSONProvider, terms), repeat=args.repeat)
+            db.session.remove()
+
+        print(
+            f"{num_terms:>8} {schema:>12.1f} {rows:>10.1f} {schema / rows:>7.1f}x "
+            f"{stdlib_json:>17.1f} {fast_json:>15.1f} {stdlib_json / fast_json:>7.1f}x"
+        )
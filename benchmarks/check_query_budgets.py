@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Check that every endpoint stays within its SQL statement budget.
+
+Each route of app.py and api.py declares in QUERY_BUDGETS how many SQL
+statements a request to it may run. The requests are sent through the flask
+test client against synthetic glossaries of different sizes, with the caches
+and the in-memory indexes emptied before each one, so the counts are the
+worst case, and the statements are counted with SQLAlchemy's
+before_cursor_execute event. Budgets do not depend on the glossary size, so
+an N+1 pattern (ex. lazy loading the definitions of each term) shows up as
+soon as the bigger glossary is used. The endpoints that have to batch their
+queries can be allowed a fixed number of statements per chunk of
+EXPORT_CHUNK_SIZE terms instead.
+
+Exits with an error, listing the offending statements, if a budget is
+exceeded or a route has no budget declared, and if a request gets a server
+error or another status than the one expected in EXPECTED_STATUSES.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/check_query_budgets.py`.
+"""
+import argparse
+import math
+import re
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from flask.testing import FlaskClient
+from glossary import populate
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
+
+from wm_what import lib
+from wm_what.app import app
+from wm_what.models import Definition, db
+
+CHECK_USER = "budgetuser"
+# modules whose routes must have a budget
+CHECKED_MODULES = ("wm_what.app", "wm_what.api")
+
+
+class QueryBudget(NamedTuple):
+    statements: int
+    # extra statements allowed per EXPORT_CHUNK_SIZE terms in the glossary
+    per_export_chunk: int = 0
+
+    def get_limit(self, num_terms: int) -> int:
+        return self.statements + self.per_export_chunk * math.ceil(num_terms / lib.EXPORT_CHUNK_SIZE)
+
+
+# endpoint -> budget, the reasons for the counts are noted when not obvious, loading
+# a name index takes two statements, the last change of the change log and the names
+QUERY_BUDGETS: Dict[str, QueryBudget] = {
+    # example names, the etag is computed from them
+    "splash": QueryBudget(1),
+    # loading the name index, the fuzzy index and the example names when nothing matches
+    "search": QueryBudget(5),
+    # term with its definitions, the etag is computed from it
+    "get_term": QueryBudget(1),
+    "login": QueryBudget(0),
+    "oauth_callback": QueryBudget(0),
+    "logout": QueryBudget(0),
+    # the writes also insert their entries in the change log, with a single statement
+    # definition, update, fetch of the new update time and change log
+    "update_definition": QueryBudget(4),
+    # term and definition inserts, fetch of the definition timestamps and change log
+    "create_term": QueryBudget(4),
+    # term check, definition insert, fetch of its timestamps and change log
+    "create_definition": QueryBudget(4),
+    # definition for the author check, then again from the primary to delete it, change log and delete
+    "delete_definition": QueryBudget(4),
+    "favicon": QueryBudget(0),
+    # name page, and loading the name index for the total, the etag is computed from them
+    "apiv1.get_terms": QueryBudget(3),
+    "apiv1.get_term": QueryBudget(1),
+    # glossary validator, definitions page and total
+    "apiv1.get_definitions": QueryBudget(3),
+    "apiv1.get_changes": QueryBudget(1),
+    # glossary validator, last change and the terms with their definitions, streamed by a single query
+    "apiv1.export": QueryBudget(3),
+    # existing names, existing definitions, term, definition and change log inserts per
+    # chunk of IMPORT_CHUNK_SIZE rows, the request sends two chunks
+    "apiv1.import_terms": QueryBudget(10),
+    # loading the prefix index
+    "apiv1.suggest": QueryBudget(2),
+    # loading the matcher, then the matched terms with their definitions
+    "apiv1.explain": QueryBudget(3),
+    "apiv1.get_stats": QueryBudget(0),
+    "apiv1.get_definition": QueryBudget(1),
+    "apiv1.update_definition": QueryBudget(4),
+    "apiv1.api_create_definition": QueryBudget(4),
+    "apiv1.delete_definition": QueryBudget(4),
+}
+
+# endpoint -> status code of its request, 200 when not listed, the budget
+# counts only mean something for requests that did what they should
+EXPECTED_STATUSES: Dict[str, int] = {
+    "update_definition": 302,
+    "create_term": 302,
+    "create_definition": 302,
+    "login": 302,
+    # there's no oauth flow to complete in the check
+    "oauth_callback": 401,
+    "logout": 302,
+}
+
+
+class Glossary(NamedTuple):
+    num_terms: int
+    # term with the most definitions, the most likely to trigger N+1s
+    big_term: str
+    # definition of CHECK_USER to update, and one to delete per delete route
+    definition_id: int
+    deleted_definition_ids: Tuple[int, int]
+
+
+class StatementRecorder:
+    def __init__(self) -> None:
+        self.recording = False
+        self.statements: List[str] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if self.recording:
+            # long IN lists would hide the rest of the statement
+            self.statements.append(re.sub(r"\?(, \?)+", "?, ...", " ".join(statement.split())))
+
+
+def _make_requests(client: FlaskClient, glossary: Glossary) -> Dict[str, Callable[[], Any]]:
+    """Request to send to each endpoint, in order, the session ones go last as they change the user."""
+    name = glossary.big_term
+    definition_id = glossary.definition_id
+    app_deleted_id, api_deleted_id = glossary.deleted_definition_ids
+    new_name = f"budget_{glossary.num_terms}"
+    return {
+        "splash": lambda: client.get("/"),
+        "search": lambda: client.get("/search", query_string={"term_name": "no term has this name"}),
+        "get_term": lambda: client.get(f"/term/{name}"),
+        "update_definition": lambda: client.post(
+            f"/definition/{definition_id}", data={"term_name": name, "content": "Updated budget definition"}
+        ),
+        "create_term": lambda: client.post("/term", data={"term_name": new_name, "content": "Budget term"}),
+        "create_definition": lambda: client.post(
+            "/definition", data={"term_name": name, "content": "Budget definition"}
+        ),
+        "delete_definition": lambda: client.delete("/definition", query_string={"id": app_deleted_id}),
+        "favicon": lambda: client.get("/favicon.ico"),
+        "apiv1.get_terms": lambda: client.get("/api/v1/terms", query_string={"limit": lib.MAX_PAGE_SIZE}),
+        "apiv1.get_term": lambda: client.get(f"/api/v1/terms/{name}"),
+        "apiv1.get_definitions": lambda: client.get("/api/v1/definitions", query_string={"limit": lib.MAX_PAGE_SIZE}),
+        "apiv1.get_changes": lambda: client.get("/api/v1/changes", query_string={"limit": lib.MAX_PAGE_SIZE}),
+        "apiv1.export": lambda: client.get("/api/v1/export"),
+        "apiv1.import_terms": lambda: client.post(
+            "/api/v1/import",
+            query_string={"on_duplicate": "merge"},
+            json=[
+                {"name": f"{new_name}_import_{row}", "definitions": [{"content": "Budget import"}]}
+                for row in range(lib.IMPORT_CHUNK_SIZE)
+            ]
+            + [{"name": name, "definitions": [{"content": "Budget import"}]}],
+        ),
+        "apiv1.suggest": lambda: client.get("/api/v1/suggest", query_string={"prefix": name[:1]}),
+        "apiv1.explain": lambda: client.post("/api/v1/explain", json={"text": f"What is {name}?"}),
+        "apiv1.get_stats": lambda: client.get("/api/v1/stats"),
+        "apiv1.get_definition": lambda: client.get(f"/api/v1/definition/{definition_id}"),
+        "apiv1.update_definition": lambda: client.post(
+            f"/api/v1/definition/{definition_id}",
+            query_string={"term_name": name, "content": "Updated budget definition"},
+        ),
+        "apiv1.api_create_definition": lambda: client.post(
+            "/api/v1/definition", data={"term_name": name, "content": "Budget definition"}
+        ),
+        "apiv1.delete_definition": lambda: client.delete(f"/api/v1/definition/{api_deleted_id}"),
+        "login": lambda: client.get("/login"),
+        "oauth_callback": lambda: client.get("/oauth_callback"),
+        "logout": lambda: client.get("/logout"),
+    }
+
+
+def get_checked_endpoints() -> List[str]:
+    return sorted(
+        endpoint
+        for endpoint, view_func in app.view_functions.items()
+        if getattr(view_func, "__module__", None) in CHECKED_MODULES
+    )
+
+
+def prepare_glossary(num_terms: int, db_path: Path) -> Glossary:
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    populate(app=app, num_terms=num_terms)
+    lib.clear_caches()
+    with app.app_context():
+        (big_term,) = (
+            db.session.query(Definition.term_name)
+            .group_by(Definition.term_name)
+            .order_by(func.count(Definition.id).desc())
+            .first()
+        )
+        definition_ids = [
+            lib.add_definition_to_term(term_name=big_term, author=CHECK_USER, content="Budget definition")["id"]
+            for _ in range(3)
+        ]
+
+    return Glossary(
+        num_terms=num_terms,
+        big_term=big_term,
+        definition_id=definition_ids[0],
+        deleted_definition_ids=(definition_ids[1], definition_ids[2]),
+    )
+
+
+def check_glossary(glossary: Glossary, recorder: StatementRecorder) -> List[str]:
+    """Send the requests and return the errors found."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["_user_id"] = CHECK_USER
+        session["username"] = CHECK_USER
+        session["_fresh"] = True
+
+    errors = []
+    for endpoint, send_request in _make_requests(client=client, glossary=glossary).items():
+        lib.clear_caches()
+        recorder.statements = []
+        recorder.recording = True
+        try:
+            response = send_request()
+            # streamed responses run their queries while being consumed
+            response.get_data()
+        finally:
+            recorder.recording = False
+
+        limit = QUERY_BUDGETS[endpoint].get_limit(glossary.num_terms)
+        print(
+            f"{glossary.num_terms:>8} {endpoint:<30} {response.status_code} "
+            f"{len(recorder.statements):>3} statements (budget {limit})"
+        )
+        if len(recorder.statements) > limit:
+            statements = "".join(f"\n    {statement}" for statement in recorder.statements)
+            errors.append(
+                f"{endpoint} ran {len(recorder.statements)} SQL statements with {glossary.num_terms} terms, "
+                f"the budget is {limit}:{statements}"
+            )
+        expected_status = EXPECTED_STATUSES.get(endpoint, 200)
+        if response.status_code != expected_status:
+            errors.append(
+                f"{endpoint} answered {response.status_code} with {glossary.num_terms} terms, "
+                f"expected {expected_status}: {response.get_data(as_text=True)[:200]!r}"
+            )
+
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--terms",
+        type=int,
+        nargs="+",
+        default=[10, 2500],
+        help="Glossary sizes to check with, use a few to catch statements growing with the size.",
+    )
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_ECHO"] = False
+    # the failing views should show up as errors, not stop the check
+    app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    errors = []
+    request_endpoints = set(_make_requests(client=app.test_client(), glossary=Glossary(0, "", 0, (0, 0))))
+    for endpoint in get_checked_endpoints():
+        if endpoint not in QUERY_BUDGETS:
+            errors.append(f"{endpoint} has no query budget, add it to QUERY_BUDGETS")
+        elif endpoint not in request_endpoints:
+            errors.append(f"{endpoint} has no request to check its budget with, add it to _make_requests")
+
+    recorder = StatementRecorder()
+    event.listen(Engine, "before_cursor_execute", recorder)
+    with tempfile.TemporaryDirectory() as db_dir:
+        for num_terms in args.terms:
+            glossary = prepare_glossary(num_terms=num_terms, db_path=Path(db_dir) / f"budgets-{num_terms}.db")
+            errors.extend(check_glossary(glossary=glossary, recorder=recorder))
+
+    if errors:
+        print("\n" + "\n\n".join(errors), file=sys.stderr)
+        sys.exit(1)
+
+    print("All the endpoints are within their query budget.")
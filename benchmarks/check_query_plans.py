@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Check the query plans of the term and definition lookups, before and after the migrations.
+
+Creates a sqlite database with the schema the tables had before
+wm_what/migrations.py, fills it with a synthetic glossary, and applies the
+migrations to it as it would be done to the live database. The statements
+the lookups run are captured from wm_what.lib, and their EXPLAIN QUERY PLAN
+is shown on a copy of the database taken before migrating and on the
+migrated one, and checked to use the expected index, instead of scanning the
+tables, after the migration.
+
+It also checks that the migrated schema has the same indexes as a new
+database, that all the terms got their normalized name, and that applying
+the migrations again does nothing.
+
+Only sqlite is checked, the plans of the MySQL production database can be
+checked with EXPLAIN on the same statements.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/check_query_plans.py`.
+"""
+import argparse
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+from glossary import generate_glossary
+from sqlalchemy import event, func, inspect
+from sqlalchemy.engine import Engine
+
+from wm_what import lib, migrations
+from wm_what.app import app
+from wm_what.models import Term, db
+
+# the schema created by db.create_all() before the migrations
+OLD_SCHEMA = """
+CREATE TABLE term (
+    name VARCHAR(80) NOT NULL,
+    PRIMARY KEY (name)
+);
+CREATE TABLE definition (
+    id INTEGER NOT NULL,
+    author VARCHAR(80) NOT NULL,
+    content VARCHAR(256) NOT NULL,
+    created TIMESTAMP DEFAULT (CURRENT_TIMESTAMP) NOT NULL,
+    updated TIMESTAMP DEFAULT (CURRENT_TIMESTAMP) NOT NULL,
+    term_name VARCHAR(80),
+    PRIMARY KEY (id),
+    FOREIGN KEY(term_name) REFERENCES term (name)
+);
+"""
+
+
+class PlanCheck(NamedTuple):
+    name: str
+    lookup: Callable[[str, str], Any]
+    # index the statements must use after the migrations
+    expected_index: str
+
+
+# the lookups get the name of the term with the most definitions, and the author with the most definitions
+PLAN_CHECKS = (
+    PlanCheck(
+        name="term with its definitions",
+        lookup=lambda term_name, _: lib.get_term(name=term_name),
+        expected_index="ix_definition_term_name",
+    ),
+    PlanCheck(
+        name="definitions of an author",
+        lookup=lambda _, author: lib.get_definitions_page(author=author),
+        expected_index="ix_definition_author",
+    ),
+    PlanCheck(
+        name="term by normalized name",
+        lookup=lambda term_name, _: lib.get_term_names_by_normalized_name(name=term_name.upper()),
+        expected_index="ix_term_normalized_name",
+    ),
+)
+
+
+class StatementRecorder:
+    def __init__(self) -> None:
+        self.statements: List[Tuple[str, Any]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append((statement, parameters))
+
+
+def create_old_database(db_path: Path, num_terms: int) -> Tuple[str, str]:
+    """Create the database with the old schema and return the biggest term and author."""
+    definition_counts: Dict[str, int] = {}
+    author_counts: Dict[str, int] = {}
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(OLD_SCHEMA)
+        for term in generate_glossary(num_terms=num_terms):
+            conn.execute("INSERT INTO term (name) VALUES (?)", (term["name"],))
+            conn.executemany(
+                "INSERT INTO definition (author, content, term_name) VALUES (?, ?, ?)",
+                [(definition["author"], definition["content"], term["name"]) for definition in term["definitions"]],
+            )
+            definition_counts[term["name"]] = len(term["definitions"])
+            for definition in term["definitions"]:
+                author_counts[definition["author"]] = author_counts.get(definition["author"], 0) + 1
+
+    return max(definition_counts, key=definition_counts.get), max(author_counts, key=author_counts.get)
+
+
+def capture_statements(plan_check: PlanCheck, term_name: str, author: str) -> List[Tuple[str, Any]]:
+    recorder = StatementRecorder()
+    event.listen(Engine, "before_cursor_execute", recorder)
+    try:
+        with app.app_context():
+            lib.clear_caches()
+            plan_check.lookup(term_name, author)
+    finally:
+        event.remove(Engine, "before_cursor_execute", recorder)
+
+    return recorder.statements
+
+
+def explain(db_path: Path, statement: str, parameters: Any) -> str:
+    """Return the query plan, one line per step, or why it failed (ex. a missing column)."""
+    with sqlite3.connect(db_path) as conn:
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        except sqlite3.OperationalError as error:
+            return f"    fails: {error}"
+
+    return "\n".join(f"    {row[-1]}" for row in rows)
+
+
+def check_schema(db_path: Path, new_db_path: Path) -> List[str]:
+    errors = []
+    with app.app_context():
+        migrated = inspect(db.engine)
+        migrated_indexes = {
+            table: sorted(index["name"] for index in migrated.get_indexes(table))
+            for table in ("term", "definition", "change")
+        }
+        missing = db.session.query(func.count(Term.name)).filter(Term.normalized_name.is_(None)).scalar()
+        if missing:
+            errors.append(f"{missing} terms have no normalized name after the migrations")
+        if migrations.apply_pending(db.engine):
+            errors.append("Applying the migrations again applied some")
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{new_db_path}"
+    with app.app_context():
+        db.create_all()
+        new = inspect(db.engine)
+        new_indexes = {
+            table: sorted(index["name"] for index in new.get_indexes(table))
+            for table in ("term", "definition", "change")
+        }
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+
+    if migrated_indexes != new_indexes:
+        errors.append(f"The migrated indexes {migrated_indexes} differ from the ones of a new database {new_indexes}")
+
+    return errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=5000, help="Terms in the synthetic glossary.")
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_ECHO"] = False
+
+    errors = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        db_path = Path(db_dir) / "migrated.db"
+        before_db_path = Path(db_dir) / "before.db"
+        term_name, author = create_old_database(db_path=db_path, num_terms=args.terms)
+        shutil.copy(db_path, before_db_path)
+
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+        with app.app_context():
+            migrations.apply_pending(db.engine)
+
+        for plan_check in PLAN_CHECKS:
+            print(f"\n{plan_check.name}, expecting {plan_check.expected_index}:")
+            for statement, parameters in capture_statements(plan_check, term_name=term_name, author=author):
+                before_plan = explain(before_db_path, statement, parameters)
+                after_plan = explain(db_path, statement, parameters)
+                print(f"  {' '.join(statement.split())}\n  before:\n{before_plan}\n  after:\n{after_plan}")
+                if plan_check.expected_index not in after_plan:
+                    errors.append(f"{plan_check.name} does not use {plan_check.expected_index}:\n{after_plan}")
+
+        errors.extend(check_schema(db_path=db_path, new_db_path=Path(db_dir) / "new.db"))
+
+    if errors:
+        print("\n" + "\n\n".join(errors), file=sys.stderr)
+        sys.exit(1)
+
+    print("\nAll the lookups use their index after the migrations.")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Check the routing of the queries between the primary database and a replica.
+
+Uses two sqlite databases as stand-ins: the primary, and a read-only copy of
+it as the replica, that never gets the writes done after the copy, so which
+one served a read shows in the data too. Checks that the reads of an
+anonymous user go to the replica, that the writes go to the primary, that
+the user that just wrote reads from the primary until REPLICA_STICKY_SECONDS
+pass, and that a session that wrote keeps reading from the primary. The
+caches are kept between the requests, as in a worker, so the writer must
+see its write even after an anonymous read cached the stale term from the
+replica.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/check_replica_routing.py`.
+"""
+import shutil
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, List, Set
+
+from flask.testing import FlaskClient
+from glossary import populate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from wm_what import lib
+from wm_what.app import app
+
+CHECK_USER = "routinguser"
+
+
+class EngineRecorder:
+    """Record the databases (primary or replica) the statements ran on."""
+
+    def __init__(self, replica_path: Path) -> None:
+        self.replica_path = replica_path
+        self.databases: List[str] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        is_replica = f"{self.replica_path}" in f"{conn.engine.url}"
+        self.databases.append("replica" if is_replica else "primary")
+
+    def run(self, send_request: Any) -> Set[str]:
+        self.databases = []
+        send_request()
+        return set(self.databases)
+
+
+def _login(client: FlaskClient) -> None:
+    with client.session_transaction() as session:
+        session["_user_id"] = CHECK_USER
+        session["username"] = CHECK_USER
+        session["_fresh"] = True
+
+
+def _check(errors: List[str], what: str, databases: Set[str], expected: Set[str]) -> None:
+    print(f"{what:<60} {', '.join(sorted(databases))}")
+    if databases != expected:
+        errors.append(f"{what} used {', '.join(sorted(databases))}, expected {', '.join(sorted(expected))}")
+
+
+if __name__ == "__main__":
+    app.config["SQLALCHEMY_ECHO"] = False
+    app.config["PROPAGATE_EXCEPTIONS"] = False
+
+    errors: List[str] = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        primary_path = Path(db_dir) / "primary.db"
+        replica_path = Path(db_dir) / "replica.db"
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{primary_path}"
+        populate(app=app, num_terms=100)
+        shutil.copy(primary_path, replica_path)
+
+        app.config["SQLALCHEMY_BINDS"] = {"replica": f"sqlite:///{replica_path}"}
+        app.config["REPLICA_BINDS"] = ["replica"]
+        app.config["SQLALCHEMY_BIND_ENGINE_OPTIONS"] = {
+            "primary": {"connect_args": {"timeout": 10}},
+            # opened read-only, any write sent to it fails
+            "replica": {
+                "creator": lambda: sqlite3.connect(f"file:{replica_path}?mode=ro", uri=True, check_same_thread=False)
+            },
+        }
+        with app.app_context():
+            # not read before the checks that expect a read from the database
+            term_name, other_term_name = lib.get_term_names(limit=2)
+        lib.clear_caches()
+
+        recorder = EngineRecorder(replica_path=replica_path)
+        event.listen(Engine, "before_cursor_execute", recorder)
+
+        reader = app.test_client()
+        writer = app.test_client()
+        _login(writer)
+        url = f"/api/v1/terms/{term_name}"
+        _check(errors, "anonymous read", recorder.run(lambda: reader.get(url)), {"replica"})
+        _check(errors, "anonymous listing", recorder.run(lambda: reader.get("/api/v1/terms")), {"replica"})
+        _check(
+            errors,
+            "definition creation",
+            recorder.run(lambda: writer.post("/definition", data={"term_name": term_name, "content": "Routed"})),
+            {"primary"},
+        )
+        # caches the term without the new definition, the replica never gets it
+        _check(errors, "anonymous read after the write", recorder.run(lambda: reader.get(url)), {"replica"})
+        _check(errors, "read by the writer right after writing", recorder.run(lambda: writer.get(url)), {"primary"})
+        if "Routed" not in writer.get(url).get_data(as_text=True):
+            errors.append("The writer does not see its own write")
+
+        app.config["REPLICA_STICKY_SECONDS"] = 0
+        other_url = f"/api/v1/terms/{other_term_name}"
+        _check(
+            errors,
+            "read by the writer once not sticky anymore",
+            recorder.run(lambda: writer.get(other_url)),
+            {"replica"},
+        )
+
+        def _write_then_read() -> None:
+            with app.app_context():
+                lib.add_definition_to_term(term_name=term_name, author=CHECK_USER, content="Routed again")
+                contents = [definition["content"] for definition in lib.get_term(name=term_name)["definitions"]]
+                if "Routed again" not in contents:
+                    errors.append("The session that wrote does not see its own write")
+
+        _check(errors, "write and read in the same session", recorder.run(_write_then_read), {"primary"})
+
+    if errors:
+        print("\n" + "\n".join(errors), file=sys.stderr)
+        sys.exit(1)
+
+    print("\nAll the queries went to the expected database.")
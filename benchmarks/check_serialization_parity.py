@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Check that the fast serialization gives the same output as the marshmallow schemas.
+
+On a synthetic glossary, plus a few terms with unusual contents (non ASCII,
+control characters, emoji, no definitions), compares what the lib reads
+return, now dumped from the rows of Core selects by wm_what.serializers,
+with what TermSchema and DefinitionSchema dump from the ORM instances, key
+order included. Then compares the JSON responses encoded by
+wm_what.fastjson with the ones the Flask default provider gives, byte for
+byte, with and without ensure_ascii and sort_keys.
+
+Exits with an error, listing the differences, if any.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/check_serialization_parity.py`.
+"""
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, List
+
+from flask.json.provider import DefaultJSONProvider
+from glossary import populate
+from sqlalchemy.orm import selectinload
+
+from wm_what import fastjson, lib
+from wm_what.app import app
+from wm_what.models import Definition, DefinitionSchema, Term, TermSchema, db
+
+CHECK_USER = "parityuser"
+UNUSUAL_TERMS = {
+    "naïve": ["Ünïcödé content, with a ñ", "Emoji \U0001f600 and a DEL \x7f"],
+    "ctrl": ['Tab\tnewline\nquote " backslash \\ slash / and \x01 \x1f'],
+    "日本": ["日本語の説明", "<script>alert('html')</script> & more"],
+}
+EMPTY_TERM = "nodefinitions"
+
+
+def _same(errors: List[str], what: str, got: Any, expected: Any) -> None:
+    # the dicts compare equal regardless of the key order, the dumps do not
+    if json.dumps(got, default=str) != json.dumps(expected, default=str):
+        errors.append(f"{what} differs:\n  got      {got!r}\n  expected {expected!r}")
+
+
+def _add_unusual_terms() -> None:
+    for name, contents in UNUSUAL_TERMS.items():
+        lib.create_term_with_definition(term_name=name, author=CHECK_USER, content=contents[0])
+        for content in contents[1:]:
+            lib.add_definition_to_term(term_name=name, author=CHECK_USER, content=content)
+    lib.add_term(term_name=EMPTY_TERM)
+
+
+def check_dumps(errors: List[str]) -> int:
+    """Compare the lib reads with the schema dumps, return how many terms were compared."""
+    lib.clear_caches()
+    orm_terms = db.session.query(Term).options(selectinload(Term.definitions)).order_by(Term.name).all()
+    expected = {term.name: TermSchema().dump(term) for term in orm_terms}
+    names = list(expected)
+
+    _same(errors, "iter_terms", list(lib.iter_terms()), list(expected.values()))
+    _same(errors, "get_terms_by_name", lib.get_terms_by_name(names), expected)
+    lib.clear_caches()
+    for name in names:
+        _same(errors, f"get_term({name!r})", lib.get_term(name=name), expected[name])
+    for name_filter in ("a", "naï", "日"):
+        terms = lib.get_terms(name_filter=name_filter, limit=20)
+        _same(errors, f"get_terms({name_filter!r})", terms, [expected[term["name"]] for term in terms])
+
+    orm_definitions = db.session.query(Definition).order_by(Definition.id).all()
+    expected_definitions = DefinitionSchema(many=True).dump(orm_definitions)
+    definitions, after = [], None
+    while True:
+        page, after = lib.get_definitions_page(after=after, limit=lib.MAX_PAGE_SIZE)
+        definitions.extend(page)
+        if after is None:
+            break
+    _same(errors, "get_definitions_page", definitions, expected_definitions)
+    for definition in expected_definitions[:100] + expected_definitions[-10:]:
+        _same(errors, f"get_definition({definition['id']})", lib.get_definition(id=definition["id"]), definition)
+
+    return len(names)
+
+
+def _encode_with(provider_class: type, data: Any, ensure_ascii: bool, sort_keys: bool) -> str:
+    provider = provider_class(app)
+    provider.ensure_ascii = ensure_ascii
+    provider.sort_keys = sort_keys
+    return provider.dumps(data, separators=(",", ":"))
+
+
+def check_encoding(errors: List[str]) -> None:
+    """Compare the fast and the stdlib JSON encodings of samples of the data."""
+    samples: List[Any] = [
+        lib.get_terms_by_name(list(UNUSUAL_TERMS) + [EMPTY_TERM]),
+        lib.get_definitions_page(limit=50)[0],
+        lib.explain_text(text=" ".join(UNUSUAL_TERMS)),
+        {"nested": [{"b": 1, "a": None, "c": [True, False]}], "big": 2**70, "": "empty key"},
+        {"only_ascii": "DEL \x7f without other non ASCII characters"},
+    ]
+    for as_ascii in (True, False):
+        for sort_keys in (True, False):
+            for index, sample in enumerate(samples):
+                fast = _encode_with(fastjson.FastJSONProvider, sample, ensure_ascii=as_ascii, sort_keys=sort_keys)
+                stdlib = _encode_with(DefaultJSONProvider, sample, ensure_ascii=as_ascii, sort_keys=sort_keys)
+                if fast != stdlib:
+                    errors.append(
+                        f"encoding of sample {index} (ensure_ascii={as_ascii}, sort_keys={sort_keys}) "
+                        f"differs:\n  fast   {fast!r}\n  stdlib {stdlib!r}"
+                    )
+
+
+def _get_responses(urls: List[str], send: Callable[[str], Any]) -> List[bytes]:
+    lib.clear_caches()
+    return [send(url).get_data() for url in urls]
+
+
+def check_responses(errors: List[str]) -> None:
+    urls = [f"/api/v1/terms/{name}" for name in UNUSUAL_TERMS] + ["/api/v1/terms", "/api/v1/definitions"]
+    client = app.test_client()
+    fast = _get_responses(urls, client.get)
+    app.json = DefaultJSONProvider(app)
+    stdlib = _get_responses(urls, client.get)
+    app.json = fastjson.FastJSONProvider(app)
+    for url, fast_body, stdlib_body in zip(urls, fast, stdlib):
+        if fast_body != stdlib_body:
+            errors.append(f"response of {url} differs:\n  fast   {fast_body[:200]!r}\n  stdlib {stdlib_body[:200]!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=2000)
+    args = parser.parse_args()
+
+    if fastjson.orjson is None:
+        print("orjson is not installed, the fast encoding falls back to the stdlib one.", file=sys.stderr)
+
+    app.config["SQLALCHEMY_ECHO"] = False
+    # the compact output, the pretty printed one always uses the stdlib encoder
+    app.debug = False
+    errors: List[str] = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{Path(db_dir) / 'parity.db'}"
+        populate(app=app, num_terms=args.terms)
+        with app.test_request_context():
+            _add_unusual_terms()
+            num_terms = check_dumps(errors)
+            check_encoding(errors)
+        check_responses(errors)
+
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+        sys.exit(1)
+
+    print(f"The fast serialization matches the schemas for the {num_terms} terms, and the stdlib JSON encoding.")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic glossaries to benchmark with.
+
+The number of definitions per term follows a Zipf distribution, so most
+terms have one or two definitions and a few have many, like the real one.
+
+Run from the repo root with
+`FLASK_ENV=development python benchmarks/glossary.py --terms 100000 --db /tmp/wm-what-bench.db`.
+"""
+import argparse
+import bisect
+import itertools
+import random
+import string
+import time
+from typing import Any, Dict, Iterator, List
+
+MAX_DEFINITIONS = 50
+ZIPF_EXPONENT = 1.5
+WORDS = [
+    "wikimedia",
+    "cloud",
+    "services",
+    "toolforge",
+    "cluster",
+    "database",
+    "replica",
+    "puppet",
+    "kubernetes",
+    "team",
+    "project",
+    "platform",
+    "api",
+    "bot",
+    "dump",
+    "wiki",
+]
+
+
+class ZipfSampler:
+    """Sample integers in [1, maximum] with probability proportional to 1 / k^exponent."""
+
+    def __init__(self, maximum: int, exponent: float, rng: random.Random) -> None:
+        self._rng = rng
+        self._cumulative_weights = list(itertools.accumulate(1 / rank**exponent for rank in range(1, maximum + 1)))
+
+    def sample(self) -> int:
+        value = self._rng.random() * self._cumulative_weights[-1]
+        return bisect.bisect_left(self._cumulative_weights, value) + 1
+
+
+def make_term_name(number: int, rng: random.Random) -> str:
+    """Short acronym like name, unique per number."""
+    suffix = ""
+    while True:
+        number, digit = divmod(number, len(string.ascii_lowercase))
+        suffix = string.ascii_lowercase[digit] + suffix
+        if not number:
+            break
+
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 3))) + "_" + suffix
+
+
+def generate_glossary(num_terms: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield terms in the import/export format."""
+    rng = random.Random(seed)
+    definitions_sampler = ZipfSampler(maximum=MAX_DEFINITIONS, exponent=ZIPF_EXPONENT, rng=rng)
+    for number in range(num_terms):
+        yield {
+            "name": make_term_name(number=number, rng=rng),
+            "definitions": [
+                {
+                    "author": f"user{rng.randint(0, 500)}",
+                    "content": " ".join(rng.choices(WORDS, k=rng.randint(2, 12))).capitalize(),
+                }
+                for _ in range(definitions_sampler.sample())
+            ],
+        }
+
+
+def term_names(num_terms: int, seed: int = 0) -> List[str]:
+    """Names of the terms generate_glossary creates with the same arguments."""
+    return [term["name"] for term in generate_glossary(num_terms=num_terms, seed=seed)]
+
+
+def populate(app, num_terms: int, seed: int = 0) -> Dict[str, Any]:
+    """Recreate the app database with a synthetic glossary."""
+    from wm_what import lib
+    from wm_what.models import db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        return lib.import_terms(rows=generate_glossary(num_terms=num_terms, seed=seed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--terms", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", required=True, help="Path of the sqlite db to create, it will be overwritten.")
+    args = parser.parse_args()
+
+    from wm_what.app import app
+
+    # the engine is created on first use, so this is still in time
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{args.db}"
+    app.config["SQLALCHEMY_ECHO"] = False
+
+    start = time.perf_counter()
+    report = populate(app=app, num_terms=args.terms, seed=args.seed)
+    print(
+        f"Created {report['terms_created']} terms with {report['definitions_created']} definitions in {args.db} "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
@@ -17,26 +17,34 @@ if __name__ == "__main__":
             "apispec-webframeworks",
             "autosemver",
             "flasgger",
-            "flask",
-            "flask-login",
-            "flask-marshmallow",
+            # app.json providers, flask-sqlalchemy 2.x does not support flask 2.3
+            "flask>=2.2,<2.3",
+            "flask-login>=0.6.2",
+            # 1.x needs flask-sqlalchemy 3
+            "flask-marshmallow>=0.14,<0.15",
             "flask-restful",
-            "flask-sqlalchemy",
+            # wm_what.routing extends its 2.x session and engine connector
+            "flask-sqlalchemy>=2.5,<3",
             "flask-markdown",
+            "marshmallow>=3,<4",
             "marshmallow-sqlalchemy",
             "requests",
             "social-auth-app-flask",
             "social-auth-app-flask-sqlalchemy",
-            "werkzeug",
+            "sqlalchemy>=1.4,<2",
+            "werkzeug>=2.2,<2.3",
         ],
         extras_require={
+            # brotli compression of the responses and static files, gzip only otherwise
+            "brotli": ["brotli"],
+            # faster encoding of the JSON responses, the stdlib encoder otherwise
+            "orjson": ["orjson"],
             "test": [
                 "mypy",
                 "black",
                 "isort",
                 "types-pyyaml",
-                "types-flask",
-            ]
+            ],
         },
         license="GPLv3",
         name="wm_what",
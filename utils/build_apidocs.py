@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+
+from wm_what import apidocs
+from wm_what.app import app
+
+parser = argparse.ArgumentParser(
+    description=(
+        "Build the api spec and docs page, to serve them as static files setting APIDOCS_STATIC_FOLDER to the output "
+        "folder."
+    )
+)
+parser.add_argument(
+    "--output",
+    type=Path,
+    default=Path(app.root_path) / "build" / "apidocs",
+    help="Folder to write the files to, wm_what/build/apidocs by default.",
+)
+args = parser.parse_args()
+
+apidocs.build(app=app, output_folder=args.output)
+print(f"Api docs written to {args.output}")
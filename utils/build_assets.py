@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+
+from wm_what import assets
+
+WM_WHAT_FOLDER = Path(assets.__file__).resolve().parent
+
+parser = argparse.ArgumentParser(
+    description=(
+        "Fingerprint and precompress the static files, to serve them with a long lived cache setting ASSETS_FOLDER to "
+        "the output folder."
+    )
+)
+parser.add_argument("--static", type=Path, default=WM_WHAT_FOLDER / "static", help="Folder with the static files.")
+parser.add_argument(
+    "--output",
+    type=Path,
+    default=WM_WHAT_FOLDER / "build" / "assets",
+    help="Folder to write the files to, wm_what/build/assets by default.",
+)
+args = parser.parse_args()
+
+manifest = assets.build(static_folder=args.static, output_folder=args.output)
+for filename, fingerprinted in manifest.items():
+    print(f"{filename} -> {fingerprinted}")
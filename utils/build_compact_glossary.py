@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+
+from wm_what import lib
+from wm_what.app import app
+from wm_what.models import db
+from wm_what.routing import stick_to_primary
+
+parser = argparse.ArgumentParser(
+    description=(
+        "Pack the glossary into the compact file the workers memory map to answer the term lookups, see "
+        "wm_what/compact.py. The running workers pick it up on their next check of the change log."
+    )
+)
+parser.add_argument(
+    "--output",
+    type=Path,
+    default=None,
+    help="File to write the glossary to, COMPACT_GLOSSARY_FILE or wm_what/build/glossary.bin by default.",
+)
+args = parser.parse_args()
+
+with app.app_context():
+    output = args.output or lib.get_compact_glossary_path() or Path(app.root_path) / "build" / "glossary.bin"
+    # a replica could be behind the change log read
+    stick_to_primary(db.session)
+    glossary = lib.build_compact_glossary(path=output)
+    print(
+        f"Compact glossary written to {output} up to change {glossary.last_change}: {glossary.term_count} terms, "
+        f"{glossary.definition_count} definitions, {glossary.size} bytes."
+    )
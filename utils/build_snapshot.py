@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+import argparse
+from pathlib import Path
+
+from wm_what import snapshot
+from wm_what.app import app
+
+parser = argparse.ArgumentParser(
+    description=(
+        "Render the term pages, the splash page and the api terms to static files, to serve the anonymous readers "
+        "from a file server or a CDN, see wm_what/snapshot.py. Only the terms changed since the previous build are "
+        "rendered again, unless --full is passed."
+    )
+)
+parser.add_argument(
+    "--output",
+    type=Path,
+    default=Path(app.root_path) / "build" / "snapshot",
+    help="Folder to write the snapshot to, wm_what/build/snapshot by default.",
+)
+parser.add_argument("--full", action="store_true", help="Render all the terms, not only the changed ones.")
+args = parser.parse_args()
+
+report = snapshot.build(app=app, output_folder=args.output, full=args.full)
+print(
+    f"{'Full' if report['full'] else 'Incremental'} snapshot written to {args.output} up to change "
+    f"{report['last_change']}: {report['terms_rendered']} terms rendered, {report['terms_removed']} removed, "
+    f"{report['terms_skipped']} skipped as their names can not be file names."
+)
@@ -3,6 +3,7 @@
 if [[ "$1" == "in_pod" ]]; then
     source $HOME/www/python/venv/bin/activate
     pip install -e wm-what/.
+    python wm-what/utils/migrate_db.py apply
 else
     cd wm-what
     git fetch --all
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+from wm_what import formats, lib
+from wm_what.app import app
+
+parser = argparse.ArgumentParser(description="Export all the terms and their definitions.")
+parser.add_argument("--format", choices=list(formats.EXPORT_FORMATS), default="ndjson")
+parser.add_argument("--output", help="File to write the export to, stdout by default.")
+args = parser.parse_args()
+
+_, writer = formats.EXPORT_FORMATS[args.format]
+with app.app_context():
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        output.writelines(writer(lib.iter_terms()))
+    finally:
+        if args.output:
+            output.close()
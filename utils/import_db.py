@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+import argparse
+import json
+from pathlib import Path
+
+from wm_what import formats, lib
+from wm_what.app import app
+
+parser = argparse.ArgumentParser(description="Import terms and definitions from a json, ndjson or csv file.")
+parser.add_argument("path", type=Path)
+parser.add_argument(
+    "--format", choices=list(formats.IMPORT_FORMATS), help="Format of the file, guessed from the extension by default."
+)
+parser.add_argument("--on-duplicate", choices=lib.IMPORT_DUPLICATE_ACTIONS, default="skip")
+parser.add_argument("--author", help="Use this author for all the definitions instead of the ones in the file.")
+parser.add_argument("--chunk-size", type=int, default=lib.IMPORT_CHUNK_SIZE)
+args = parser.parse_args()
+
+import_format = args.format or args.path.suffix.lstrip(".")
+if import_format not in formats.IMPORT_FORMATS:
+    parser.error(f"Unable to guess the format of {args.path}, please pass --format.")
+
+with app.app_context(), args.path.open(newline="") as import_file:
+    print(f"Importing {args.path} into {app.config['SQLALCHEMY_DATABASE_URI']}")
+    report = lib.import_terms(
+        rows=formats.IMPORT_FORMATS[import_format](import_file),
+        on_duplicate=args.on_duplicate,
+        author=args.author,
+        chunk_size=args.chunk_size,
+    )
+
+print(json.dumps(report, indent=4))
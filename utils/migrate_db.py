@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import argparse
+
+from wm_what import migrations
+from wm_what.app import app, db
+
+parser = argparse.ArgumentParser(description="Show or apply the pending schema migrations, see wm_what/migrations.py.")
+parser.add_argument(
+    "action",
+    choices=["status", "apply", "stamp"],
+    help=(
+        "status lists the migrations, apply applies the pending ones, stamp records them all as applied without "
+        "running them, for databases created with the current schema."
+    ),
+)
+args = parser.parse_args()
+
+with app.app_context():
+    print(f"Database at {app.config['SQLALCHEMY_DATABASE_URI']}")
+    if args.action == "apply":
+        applied = migrations.apply_pending(db.engine)
+        print(f"Applied {len(applied)} migrations.")
+    elif args.action == "stamp":
+        migrations.stamp_all(db.engine)
+        print("Recorded all the migrations as applied.")
+    else:
+        applied_dates = migrations.get_applied(db.engine)
+        for migration in migrations.MIGRATIONS:
+            status = f"applied {applied_dates[migration.name]}" if migration.name in applied_dates else "pending"
+            print(f"{migration.name:<40} {status:<35} {migration.description}")
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from wm_what import migrations
 from wm_what.app import app, db
 from wm_what.models import Definition, Term
 
@@ -26,6 +27,8 @@ with app.app_context():
     print(f"Initializing DB at {app.config['SQLALCHEMY_DATABASE_URI']}")
     db.drop_all()
     db.create_all()
+    # the new tables already have the migrated schema
+    migrations.stamp_all(db.engine)
 
     for term_name, term in TERMS.items():
         myterm = Term(name=term_name)
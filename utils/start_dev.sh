@@ -1,5 +1,9 @@
 #!/bin/bash -e
 
-[[ -e dev.db ]] || FLASK_ENV=development python utils/setup_db.py
+if [[ -e dev.db ]]; then
+    FLASK_ENV=development python utils/migrate_db.py apply
+else
+    FLASK_ENV=development python utils/setup_db.py
+fi
 
 FLASK_ENV=development python wm_what/app.py "$@"
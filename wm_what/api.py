@@ -1,16 +1,40 @@
-from flask import Blueprint, request
+import io
+
+from flask import Blueprint, Response, current_app, request, stream_with_context
+from flask_login import current_user
 from flask_login.utils import login_required
 
-from wm_what import lib
+from wm_what import formats, lib
+from wm_what.conditional import conditional_response
 
 apiv1 = Blueprint(name="apiv1", import_name=__name__)
 
 
+def _get_page_size() -> int:
+    limit = request.args.get("limit", lib.DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(limit, lib.MAX_PAGE_SIZE))
+
+
 @apiv1.route("/terms")
 def get_terms():
-    """Retrieve all the existing terms.
+    """Retrieve a page of the existing terms, sorted by name.
     ---
-    parameters: []
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of terms to return (100 by default, 1000 at most)
+      - name: after
+        in: query
+        type: string
+        required: false
+        description: Cursor to continue from, the `next` value of the previous page
+      - name: filter
+        in: query
+        type: string
+        required: false
+        description: Only return the terms containing this string
     responses:
       200:
         description: The list of known terms
@@ -20,11 +44,25 @@ def get_terms():
             terms:
               type: array
               items:
-                  type: Term
+                  type: string
+            next:
+              type: string
+              description: Cursor for the next page, null if this is the last one
+            total:
+              type: integer
+              description: Approximate number of terms matching
         examples:
     """
-    terms = lib.get_terms()
-    return {"terms": [term["name"] for term in terms]}
+
+    name_filter = request.args.get("filter")
+    names, next_cursor = lib.get_term_names_page(
+        after=request.args.get("after"),
+        limit=_get_page_size(),
+        name_filter=name_filter,
+    )
+    # from the name indexes, cheap enough to build for the 304s too
+    page = {"terms": names, "next": next_cursor, "total": lib.count_terms(name_filter=name_filter)}
+    return conditional_response(etag=lib.get_content_etag(page), last_modified=None, make_body=lambda: page)
 
 
 @apiv1.route("/terms/<term_name>")
@@ -51,7 +89,335 @@ def get_term(term_name: str):
     except lib.NotFound as error:
         return (f"{error}", 404)
 
-    return term
+    etag, last_modified = lib.get_term_validator(term)
+    return conditional_response(etag=etag, last_modified=last_modified, make_body=lambda: term)
+
+
+@apiv1.route("/definitions")
+def get_definitions():
+    """Retrieve a page of the existing definitions, sorted by id.
+    ---
+    parameters:
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of definitions to return (100 by default, 1000 at most)
+      - name: after
+        in: query
+        type: integer
+        required: false
+        description: Cursor to continue from, the `next` value of the previous page
+      - name: author
+        in: query
+        type: string
+        required: false
+        description: Only return the definitions by this author
+    responses:
+      200:
+        description: The list of definitions
+        schema:
+          type: object
+          properties:
+            definitions:
+              type: array
+              items:
+                $ref: '#/definitions/Definition'
+            next:
+              type: integer
+              description: Cursor for the next page, null if this is the last one
+    """
+
+    def _get_page():
+        definitions, next_cursor = lib.get_definitions_page(
+            after=request.args.get("after", type=int),
+            limit=_get_page_size(),
+            author=request.args.get("author"),
+        )
+        return {"definitions": definitions, "next": next_cursor}
+
+    etag, last_modified = lib.get_glossary_validator()
+    return conditional_response(etag=etag, last_modified=last_modified, make_body=_get_page)
+
+
+@apiv1.route("/changes")
+def get_changes():
+    """Retrieve the changes to the glossary since a given one, oldest first, to sync incrementally.
+
+    Only the changes older than CHANGES_SETTLE_SECONDS (10 by default) are
+    served, and none after the first that is not, as a write can commit after
+    a later one: the sequence numbers are given on insert. So consumers can
+    sync from the last one they saw without re-reading an overlap, and see a
+    change that long after it's made.
+    ---
+    parameters:
+      - name: since
+        in: query
+        type: integer
+        required: false
+        description: Sequence number of the last change already seen, 0 (the default) to get all of them
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of changes to return (100 by default, 1000 at most)
+    responses:
+      200:
+        description: The changes, each refers to a term, and to a definition of it if only that one changed
+        schema:
+          type: object
+          properties:
+            changes:
+              type: array
+              items:
+                $ref: '#/definitions/Change'
+            next:
+              type: integer
+              description: Sequence number to pass as since to get the following changes
+            has_more:
+              type: boolean
+              description: Whether there are more changes already, false once synced
+    """
+    changes, next_seq, has_more = lib.get_changes_page(
+        since=max(0, request.args.get("since", 0, type=int)), limit=_get_page_size()
+    )
+    return {"changes": changes, "next": next_seq, "has_more": has_more}
+
+
+@apiv1.route("/export")
+def export():
+    """Export all the terms with their definitions.
+    ---
+    parameters:
+      - name: format
+        in: query
+        type: string
+        enum: [ndjson, csv]
+        required: false
+        description: ndjson (the default) has one Term object per line, csv one row per definition
+    responses:
+        200:
+            description: The whole glossary, streamed
+            headers:
+              X-Last-Change:
+                type: integer
+                description: Sequence number of the last change before the export, to sync from with /changes
+        403:
+            description: Unknown export format
+            schema:
+                type: string
+    """
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in formats.EXPORT_FORMATS:
+        return (f"Bad request, unknown format {export_format}, known: {', '.join(formats.EXPORT_FORMATS)}", 403)
+
+    mimetype, writer = formats.EXPORT_FORMATS[export_format]
+    etag, last_modified = lib.get_glossary_validator()
+    return conditional_response(
+        etag=etag,
+        last_modified=last_modified,
+        make_body=lambda: Response(
+            stream_with_context(writer(lib.iter_terms())),
+            mimetype=mimetype,
+            headers={
+                "Content-Disposition": f"attachment; filename=wm-what.{export_format}",
+                # the changes after it might already be in the export, applying them again is harmless
+                "X-Last-Change": f"{lib.get_last_change_seq()}",
+            },
+        ),
+    )
+
+
+# request mimetype -> import format
+IMPORT_MIMETYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "text/csv": "csv",
+}
+
+
+@apiv1.route("/import", methods=["POST"])
+@login_required
+def import_terms():
+    """Create terms and definitions in bulk.
+    ---
+    post:
+        consumes:
+        - application/json
+        - application/x-ndjson
+        - text/csv
+        parameters:
+        - name: on_duplicate
+          in: query
+          type: string
+          enum: [skip, merge]
+          required: false
+          description: What to do with terms that already exist, skip them (the default) or add the new definitions
+        - name: body
+          in: body
+          required: true
+          description: Same format as the export, all the definitions are created with the current user as author
+    responses:
+        200:
+            description: Report of the import
+            schema:
+              type: object
+              properties:
+                terms_created:
+                  type: integer
+                definitions_created:
+                  type: integer
+                skipped:
+                  type: integer
+                errors:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      row:
+                        type: integer
+                      error:
+                        type: string
+        403:
+            description: Bad request, unknown content type or on_duplicate action
+            schema:
+                type: string
+    """
+    if request.mimetype not in IMPORT_MIMETYPES:
+        return (f"Bad request, unsupported content type {request.mimetype}, known: {', '.join(IMPORT_MIMETYPES)}", 403)
+
+    on_duplicate = request.args.get("on_duplicate", "skip")
+    if on_duplicate not in lib.IMPORT_DUPLICATE_ACTIONS:
+        return (f"Bad request, unknown on_duplicate action {on_duplicate}", 403)
+
+    reader = formats.IMPORT_FORMATS[IMPORT_MIMETYPES[request.mimetype]]
+    try:
+        rows = list(reader(io.StringIO(request.get_data(as_text=True))))
+    except ValueError as error:
+        return (f"Bad request, unable to parse the payload: {error}", 403)
+
+    return lib.import_terms(rows=rows, on_duplicate=on_duplicate, author=current_user.username)
+
+
+@apiv1.route("/suggest")
+def suggest():
+    """Complete a term name, for the search box.
+    ---
+    parameters:
+      - name: prefix
+        in: query
+        type: string
+        required: true
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum number of suggestions (10 by default, 50 at most)
+    responses:
+      200:
+        description: The term names starting with the prefix, case insensitive, sorted alphabetically
+        schema:
+          type: object
+          properties:
+            suggestions:
+              type: array
+              items:
+                  type: string
+    """
+    prefix = request.args.get("prefix", "")
+    if not prefix:
+        return {"suggestions": []}
+
+    limit = max(1, min(request.args.get("limit", lib.DEFAULT_SUGGESTIONS, type=int), lib.MAX_SUGGESTIONS))
+    return {"suggestions": lib.suggest_term_names(prefix=prefix, limit=limit)}
+
+
+DEFAULT_EXPLAIN_MAX_LENGTH = 100000
+
+
+@apiv1.route("/explain", methods=["POST"])
+def explain():
+    """Find all the known terms in a text.
+    ---
+    post:
+        consumes:
+        - application/json
+        - text/plain
+        parameters:
+        - name: body
+          in: body
+          required: true
+          description: The text, either as plain text or as a json object with a `text` key
+    responses:
+        200:
+            description: The terms found, with their positions in the text
+            schema:
+              type: object
+              properties:
+                matches:
+                  type: array
+                  items:
+                    type: object
+                    properties:
+                      start:
+                        type: integer
+                      end:
+                        type: integer
+                      term:
+                        type: string
+                terms:
+                  type: object
+                  additionalProperties:
+                    $ref: '#/definitions/Term'
+        403:
+            description: Bad request, missing text or too long
+            schema:
+                type: string
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return ("Bad request, expected a json object with a `text` key", 403)
+
+        text = payload.get("text")
+    else:
+        text = request.get_data(as_text=True)
+
+    if not isinstance(text, str) or not text:
+        return ("Bad request, missing text in post payload", 403)
+
+    max_length = current_app.config.get("EXPLAIN_MAX_LENGTH", DEFAULT_EXPLAIN_MAX_LENGTH)
+    if len(text) > max_length:
+        return (f"Bad request, the text is longer than {max_length} characters", 403)
+
+    return lib.explain_text(text=text)
+
+
+@apiv1.route("/stats")
+def get_stats():
+    """Retrieve the internal cache, request coalescing and compact glossary statistics.
+    ---
+    parameters: []
+    responses:
+        200:
+            description: Size, hits, misses, evictions and expirations of each cache, and the lookups run, the
+              ones coalesced with an identical one already running and the coalescing rate of each lookup, and the
+              size, terms, definitions, last change and stale terms of the compact glossary when loaded
+            schema:
+              type: object
+              properties:
+                cache:
+                  type: object
+                single_flight:
+                  type: object
+                compact_glossary:
+                  type: object
+    """
+    return {
+        "cache": lib.get_cache_stats(),
+        "single_flight": lib.get_single_flight_stats(),
+        "compact_glossary": lib.compact_glossary.stats(),
+    }
 
 
 @apiv1.route("/definition/<id>")
@@ -123,7 +489,7 @@ def update_definition(id: int):
 
 @apiv1.route("/definition", methods=["POST"])
 @login_required
-def api_create_definition(user: str):
+def api_create_definition():
     """Create a new definition.
     ---
     post:
@@ -156,7 +522,7 @@ def api_create_definition(user: str):
         definition = lib.add_definition_to_term(
             term_name=term_name,
             content=content,
-            author=user,
+            author=current_user.username,
         )
     except lib.NotFound as error:
         return (f"{error}", 404)
@@ -166,7 +532,7 @@ def api_create_definition(user: str):
 
 @apiv1.route("/definition/<id>", methods=["DELETE"])
 @login_required
-def delete_definition(id: int, user: str):
+def delete_definition(id: int):
     """Delete a definition.
     ---
     post:
@@ -193,7 +559,7 @@ def delete_definition(id: int, user: str):
     except lib.NotFound as error:
         return (f"{error}", 404)
 
-    if definition["author"] != user:
+    if definition["author"] != current_user.username:
         return (f"Unauthorized, you are not the user that created this definition.", 401)
 
     lib.delete_definition(id=id)
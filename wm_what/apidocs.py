@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Swagger UI and spec of the api, set up on the first request to them.
+
+flasgger and apispec are slow to import, and building the spec template from
+the marshmallow schemas is slow too, so instead of setting up flasgger when
+creating the app this registers the same routes, with views that set it up
+on first use. That keeps the worker startup fast.
+
+The spec and the docs page can also be built beforehand with
+utils/build_apidocs.py, and served as static files by setting
+APIDOCS_STATIC_FOLDER to the folder they were written to, so the workers
+never load flasgger.
+"""
+import importlib.util
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+import flask
+from flask import Blueprint, Flask
+
+from wm_what.paths import get_config_path
+
+# same names and routes flasgger uses by default
+BLUEPRINT_NAME = "flasgger"
+SPECS_ENDPOINT = "apispec_1"
+SPECS_ROUTE = "/apispec_1.json"
+DOCS_ROUTE = "/apidocs/"
+STATIC_URL_PATH = "/flasgger_static"
+SWAGGER_UI_VERSION = 3
+
+SPEC_FILE_NAME = "apispec_1.json"
+DOCS_FILE_NAME = "apidocs.html"
+# seconds, the built files only change when deploying
+DEFAULT_APIDOCS_MAX_AGE = 3600
+
+_swagger_lock = threading.Lock()
+
+
+def _get_swagger() -> Any:
+    # flasgger keeps the app, not the proxy
+    app: Flask = flask.current_app._get_current_object()  # type: ignore[attr-defined]
+    with _swagger_lock:
+        if "wm_what_swagger" not in app.extensions:
+            from apispec.ext.marshmallow import MarshmallowPlugin
+            from apispec_webframeworks.flask import FlaskPlugin
+            from flasgger import APISpec, Swagger  # type: ignore
+
+            from wm_what.models import ChangeSchema, DefinitionSchema, TermSchema
+
+            spec = APISpec(
+                title="Wikimedia What api",
+                version="0.0.1",
+                openapi_version="2.0",
+                plugins=[
+                    FlaskPlugin(),
+                    MarshmallowPlugin(),
+                ],
+            )
+            swagger = Swagger(template=spec.to_flasgger(app, definitions=[ChangeSchema, DefinitionSchema, TermSchema]))
+            # the routes are registered by init_app, only the spec generation is used
+            swagger.app = app
+            swagger.load_config(app)
+            app.extensions["wm_what_swagger"] = swagger
+
+    return app.extensions["wm_what_swagger"]
+
+
+def _render_docs_page() -> str:
+    from flasgger.base import APIDocsView  # type: ignore
+
+    return APIDocsView(view_args={"config": _get_swagger().config}).get()
+
+
+def _get_spec() -> str:
+    app = flask.current_app
+    # flasgger regenerates the spec on each request in debug mode, to pick up changes
+    if app.debug or "wm_what_apispec" not in app.extensions:
+        app.extensions["wm_what_apispec"] = flask.json.dumps(_get_swagger().get_apispecs(endpoint=SPECS_ENDPOINT))
+
+    return app.extensions["wm_what_apispec"]
+
+
+def build(app: Flask, output_folder: Path) -> None:
+    """Write the spec and the docs page to the output folder, to serve them with APIDOCS_STATIC_FOLDER."""
+    with app.test_request_context():
+        spec = _get_spec()
+        docs_page = _render_docs_page()
+
+    output_folder.mkdir(parents=True, exist_ok=True)
+    (output_folder / SPEC_FILE_NAME).write_text(spec)
+    (output_folder / DOCS_FILE_NAME).write_text(docs_page)
+
+
+def _get_static_file(file_name: str) -> Optional[Path]:
+    static_folder = get_config_path(flask.current_app, "APIDOCS_STATIC_FOLDER")
+    if static_folder is None:
+        return None
+
+    path = static_folder / file_name
+    if not path.is_file():
+        flask.current_app.logger.warning(f"Missing {path}, building the api docs at runtime instead.")
+        return None
+
+    return path
+
+
+def _send_static_file(path: Path, mimetype: str) -> flask.Response:
+    return flask.send_file(
+        path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=True,
+        max_age=flask.current_app.config.get("APIDOCS_MAX_AGE", DEFAULT_APIDOCS_MAX_AGE),
+    )
+
+
+def apidocs():
+    path = _get_static_file(DOCS_FILE_NAME)
+    if path:
+        return _send_static_file(path=path, mimetype="text/html")
+
+    return _render_docs_page()
+
+
+def apispec():
+    path = _get_static_file(SPEC_FILE_NAME)
+    if path:
+        return _send_static_file(path=path, mimetype="application/json")
+
+    return flask.current_app.response_class(_get_spec(), mimetype="application/json")
+
+
+def init_app(app: Flask) -> None:
+    # locating the package does not import it
+    flasgger_spec = importlib.util.find_spec("flasgger")
+    if flasgger_spec is None or flasgger_spec.origin is None:
+        raise ModuleNotFoundError("flasgger is needed for the api docs, install it with the requirements")
+
+    flasgger_folder = Path(flasgger_spec.origin).parent
+    ui_folder = flasgger_folder / f"ui{SWAGGER_UI_VERSION}"
+    blueprint = Blueprint(
+        BLUEPRINT_NAME,
+        __name__,
+        template_folder=str(ui_folder / "templates"),
+        static_folder=str(ui_folder / "static"),
+        static_url_path=STATIC_URL_PATH,
+    )
+    blueprint.add_url_rule(DOCS_ROUTE, "apidocs", view_func=apidocs)
+    # backwards compatibility with the old url, like flasgger
+    blueprint.add_url_rule(
+        f"{DOCS_ROUTE}index.html",
+        "apidocs_index",
+        view_func=lambda: flask.redirect(flask.url_for(f"{BLUEPRINT_NAME}.apidocs")),
+    )
+    blueprint.add_url_rule(SPECS_ROUTE, SPECS_ENDPOINT, view_func=apispec)
+    app.register_blueprint(blueprint)
@@ -1,48 +1,48 @@
 #!/usr/bin/env python3
 """
 Entry point file for the application.
+
+The app is created by create_app, or on first access to the module `app`
+attribute (what the wsgi server loads), so importing this module is cheap.
 """
 import os
 import random
 import string
+import threading
 from logging.config import dictConfig
 from pathlib import Path
+from typing import Any
 from urllib.parse import quote_plus
 
 import flask
 import flask_login
-import requests
 import yaml
-from apispec.ext.marshmallow import MarshmallowPlugin
-from apispec_webframeworks.flask import FlaskPlugin
-from flasgger import APISpec, Swagger  # type: ignore
 from flask import Flask, render_template  # type: ignore
-from flask_login import LoginManager, current_user, login_manager
+from flask_login import LoginManager, current_user
 from flask_login.utils import login_required, login_user
 from flaskext.markdown import Markdown
 
-from wm_what import lib
+from wm_what import apidocs, assets, compression, fastjson, lib, metrics, rendering
 from wm_what.api import apiv1
-from wm_what.models import DefinitionSchema, TermSchema, User, db, ma
-
-dictConfig(
-    {
-        "version": 1,
-        "formatters": {
-            "default": {
-                "format": ("[%(asctime)s] %(levelname)s in %(module)s: %(message)s"),
-            }
-        },
-        "handlers": {
-            "wsgi": {
-                "class": "logging.StreamHandler",
-                "stream": "ext://flask.logging.wsgi_errors_stream",
-                "formatter": "default",
-            }
-        },
-        "root": {"level": "DEBUG", "handlers": ["wsgi"]},
-    }
-)
+from wm_what.conditional import conditional_response
+from wm_what.models import User, db, ma
+
+LOGGING_CONFIG = {
+    "version": 1,
+    "formatters": {
+        "default": {
+            "format": ("[%(asctime)s] %(levelname)s in %(module)s: %(message)s"),
+        }
+    },
+    "handlers": {
+        "wsgi": {
+            "class": "logging.StreamHandler",
+            "stream": "ext://flask.logging.wsgi_errors_stream",
+            "formatter": "default",
+        }
+    },
+    "root": {"level": "DEBUG", "handlers": ["wsgi"]},
+}
 
 
 THIS_FILE_FOLDER = Path(__file__).resolve().absolute().parent
@@ -51,38 +51,11 @@ REPO_FOLDER = THIS_FILE_FOLDER.parent
 if REPO_FOLDER.name != "wm_what":
     REPO_FOLDER = REPO_FOLDER / "wm_what"
 
-app = Flask(__name__)
-Markdown(app, safe_mode=True)
-login_manager = LoginManager()
-login_manager.init_app(app)
-app.register_blueprint(apiv1, url_prefix="/api/v1")
-
-spec = APISpec(
-    title="Wikimedia What api",
-    version="0.0.1",
-    openapi_version="2.0",
-    plugins=[
-        FlaskPlugin(),
-        MarshmallowPlugin(),
-    ],
-)
-template = spec.to_flasgger(app, definitions=[DefinitionSchema, TermSchema])
-swagger = Swagger(app, template=template)
-
-
-if app.config["ENV"] == "production":
-    config_file = "prod-config.yaml"
-
-elif app.config["ENV"] == "development":
-    config_file = "dev-config.yaml"
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////" + str(REPO_FOLDER / "dev.db")
-    app.config["SECRET_KEY"] = "".join(random.choice(string.ascii_letters) for _ in range(32))
-
+# seconds, the url can not change with the content, unlike the one linked from the pages
+FAVICON_MAX_AGE = 24 * 3600
 
-app.config.update(yaml.safe_load((REPO_FOLDER / config_file).open()))
-app.secret_key = app.config["SECRET_KEY"]
-db.init_app(app)
-ma.init_app(app)
+login_manager = LoginManager()
+_app_lock = threading.Lock()
 
 
 @login_manager.user_loader
@@ -90,66 +63,86 @@ def load_user(user_id):
     return User(username=user_id)
 
 
-@app.route("/")
 def splash():
-    example_terms = lib.get_terms(limit=25)
-    return render_template("splash.html", example_terms=example_terms, user=current_user.get_id())
+    example_terms = lib.get_term_names(limit=25)
+    return conditional_response(
+        # the page shows the logged in user
+        etag=f"{lib.get_content_etag(example_terms)}-{current_user.get_id()}",
+        last_modified=None,
+        make_body=lambda: render_template("splash.html", example_terms=example_terms, user=current_user.get_id()),
+        private=True,
+    )
 
 
-@app.route("/search")
 def search():
     term_name = flask.request.args.get("term_name")
-    terms = lib.get_terms(name_filter=term_name)
+    terms = lib.get_term_names(name_filter=term_name)
+    similar_terms = None
+    example_terms = None
     if not terms:
-        example_terms = lib.get_terms(limit=25)
-    else:
-        example_terms = None
+        similar_terms = lib.get_similar_term_names(name=term_name) if term_name else None
+        if not similar_terms:
+            example_terms = lib.get_term_names(limit=25)
 
     if len(terms) == 1:
-        return flask.redirect(flask.url_for("get_term", term_name=term_name))
+        return flask.redirect(flask.url_for("get_term", term_name=terms[0]))
 
     return render_template(
         "search_results.html",
         terms=terms,
         search_value=term_name or "",
+        similar_terms=similar_terms,
         example_terms=example_terms,
         user=current_user.get_id(),
-        exact_match=any(term["name"] == term_name for term in terms),
+        exact_match=term_name in terms,
     )
 
 
-@app.route("/term/<term_name>")
 def get_term(term_name):
-    term = lib.get_term(name=term_name)
-    if not term:
+    try:
+        term = lib.get_term(name=term_name)
+    except lib.NotFound:
+        # ex. from links typed by hand with a different case
+        similar_names = lib.get_term_names_by_normalized_name(name=term_name)
+        if similar_names:
+            return flask.redirect(flask.url_for("get_term", term_name=similar_names[0]))
+
         return (f"Term with name '{term_name}' not found.", 404)
 
-    has_definition = any(definition["author"] == flask.session.get("username") for definition in term["definitions"])
-    return render_template(
-        "term.html",
-        term=term,
-        has_definition=has_definition,
-        user=current_user.get_id(),
+    def _render_term():
+        has_definition = any(
+            definition["author"] == flask.session.get("username") for definition in term["definitions"]
+        )
+        return render_template(
+            "term.html",
+            term=term,
+            has_definition=has_definition,
+            user=current_user.get_id(),
+        )
+
+    # the page shows the logged in user, and the edit forms for their definitions
+    etag, last_modified = lib.get_term_validator(term)
+    return conditional_response(
+        etag=f"{etag}-{current_user.get_id()}", last_modified=last_modified, make_body=_render_term, private=True
     )
 
 
-@app.route("/login")
 def login():
     """Initiate an OAuth login.
 
     Call the MediaWiki server to get request secrets and then redirect the
     user to the MediaWiki server to sign the request.
     """
-    if app.config["ENV"] == "development" and not app.config.get("FORCE_OAUTH_LOGIN"):
+    if flask.current_app.config["ENV"] == "development" and not flask.current_app.config.get("FORCE_OAUTH_LOGIN"):
         return flask.redirect(flask.url_for("oauth_callback"))
 
-    base_url = app.config["WIKIMEDIA_OAUTH2_URL"]
+    base_url = flask.current_app.config["WIKIMEDIA_OAUTH2_URL"]
     authorization_url = base_url + "/oauth2/authorize"
     state = "".join(random.choice(string.ascii_letters) for _ in range(16))
 
     params = {
         "response_type": "code",
-        "client_id": app.config["WIKIMEDIA_OAUTH2_TOKEN"],
+        "client_id": flask.current_app.config["WIKIMEDIA_OAUTH2_TOKEN"],
         "redirect_uri": flask.url_for("oauth_callback", _external=True),
         "state": state,
     }
@@ -162,10 +155,9 @@ def login():
     return flask.redirect(final_url)
 
 
-@app.route("/oauth_callback")
 def oauth_callback():
     """OAuth handshake callback."""
-    if app.config["ENV"] == "development" and not app.config.get("FORCE_OAUTH_LOGIN"):
+    if flask.current_app.config["ENV"] == "development" and not flask.current_app.config.get("FORCE_OAUTH_LOGIN"):
         flask.session["username"] = "devuser"
         return flask.redirect(flask.url_for("splash"))
 
@@ -177,12 +169,12 @@ def oauth_callback():
         flask.flash("OAuth callback failed. No code received.")
         return flask.redirect(flask.url_for("splash"))
 
-    base_url = app.config["WIKIMEDIA_OAUTH2_URL"]
+    base_url = flask.current_app.config["WIKIMEDIA_OAUTH2_URL"]
 
     params = {
         "grant_type": "authorization_code",
-        "client_id": app.config["WIKIMEDIA_OAUTH2_TOKEN"],
-        "client_secret": app.config["WIKIMEDIA_OAUTH2_SECRET"],
+        "client_id": flask.current_app.config["WIKIMEDIA_OAUTH2_TOKEN"],
+        "client_secret": flask.current_app.config["WIKIMEDIA_OAUTH2_SECRET"],
         "redirect_uri": flask.url_for("oauth_callback", _external=True),
         "code": code,
     }
@@ -191,13 +183,15 @@ def oauth_callback():
     # params_str = "&".join(f"{name}={quote_plus(value)}" for name, value in params.items())
     access_token_url = base_url + "/oauth2/access_token"
 
+    import requests
+
     try:
         token_response = requests.post(
             url=access_token_url, data=params_str, headers={"Content-type": "application/x-www-form-urlencoded"}
         )
         token_response.raise_for_status()
     except Exception as error:
-        app.logger.exception(f"OAuth token request failed: {error}")
+        flask.current_app.logger.exception(f"OAuth token request failed: {error}")
         raise
 
     flask.session["access_token"] = token_response.json()["access_token"]
@@ -210,20 +204,19 @@ def oauth_callback():
         )
         identity_response.raise_for_status()
     except Exception as error:
-        app.logger.exception(f"OAuth identity request failed: {error}")
+        flask.current_app.logger.exception(f"OAuth identity request failed: {error}")
         raise
 
     if identity_response.json()["blocked"]:
-        app.logger.exception("User is blocked")
+        flask.current_app.logger.exception("User is blocked")
         return (f"Unauthorized, your user is blocked in wikimedia.", 401)
 
     flask.session["username"] = identity_response.json()["username"]
-    app.logger.info(f"OAuth identity confirmed: {flask.session['username']}")
+    flask.current_app.logger.info(f"OAuth identity confirmed: {flask.session['username']}")
     login_user(User(username=flask.session["username"]))
     return flask.redirect(flask.url_for("splash"))
 
 
-@app.route("/logout")
 def logout():
     """Log the user out by clearing their session."""
     flask_login.logout_user()
@@ -231,7 +224,6 @@ def logout():
     return flask.redirect(flask.url_for("splash"))
 
 
-@app.route("/definition/<definition_id>", methods=["POST"])
 @login_required
 def update_definition(definition_id: int):
     term_name = flask.request.form.get("term_name")
@@ -259,7 +251,6 @@ def update_definition(definition_id: int):
     return flask.redirect(flask.url_for("get_term", term_name=term_name))
 
 
-@app.route("/term", methods=["POST"])
 @login_required
 def create_term():
     term_name = flask.request.form.get("term_name")
@@ -269,19 +260,17 @@ def create_term():
     if not content:
         return ("Bad request, missing content in post payload", 403)
     try:
-        lib.add_term(term_name=term_name)
-        lib.add_definition_to_term(
+        lib.create_term_with_definition(
             term_name=term_name,
             content=content,
             author=current_user.username,
         )
-    except lib.NotFound as error:
-        return (f"{error}", 404)
+    except lib.AlreadyExists as error:
+        return (f"{error}", 409)
 
     return flask.redirect(flask.url_for("get_term", term_name=term_name))
 
 
-@app.route("/definition", methods=["POST"])
 @login_required
 def create_definition():
     term_name = flask.request.form.get("term_name")
@@ -302,7 +291,6 @@ def create_definition():
     return flask.redirect(flask.url_for("get_term", term_name=term_name))
 
 
-@app.route("/definition", methods=["DELETE"])
 @login_required
 def delete_definition():
     def_id = flask.request.args.get("id")
@@ -314,20 +302,87 @@ def delete_definition():
     except lib.NotFound as error:
         return (f"{error}", 404)
 
-    if definition.author != current_user.username:
+    if definition["author"] != current_user.username:
         return (f"Unauthorized, you are not the user that created this definition.", 401)
 
     lib.delete_definition(id=def_id)
     return ("Definition deleted", 200)
 
 
-@app.route("/favicon.ico")
 def favicon():
     return flask.send_from_directory(
-        os.path.join(app.root_path, "static"), "favicon.ico", mimetype="image/vnd.microsoft.icon"
+        os.path.join(flask.current_app.root_path, "static"),
+        "favicon.ico",
+        mimetype="image/vnd.microsoft.icon",
+        max_age=FAVICON_MAX_AGE,
+    )
+
+
+def create_app() -> Flask:
+    dictConfig(LOGGING_CONFIG)
+    app = Flask(__name__)
+    Markdown(app, safe_mode=True)
+    app.add_template_filter(rendering.render_definition)
+    login_manager.init_app(app)
+    metrics.init_app(app)
+    compression.init_app(app)
+    fastjson.init_app(app)
+    assets.init_app(app)
+    app.register_blueprint(apiv1, url_prefix="/api/v1")
+    apidocs.init_app(app)
+
+    app.add_url_rule("/", view_func=splash)
+    app.add_url_rule("/search", view_func=search)
+    app.add_url_rule("/term/<term_name>", view_func=get_term)
+    app.add_url_rule("/login", view_func=login)
+    app.add_url_rule("/oauth_callback", view_func=oauth_callback)
+    app.add_url_rule("/logout", view_func=logout)
+    app.add_url_rule("/definition/<definition_id>", view_func=update_definition, methods=["POST"])
+    app.add_url_rule("/term", view_func=create_term, methods=["POST"])
+    app.add_url_rule("/definition", view_func=create_definition, methods=["POST"])
+    app.add_url_rule("/definition", view_func=delete_definition, methods=["DELETE"])
+    app.add_url_rule("/favicon.ico", view_func=favicon)
+
+    if app.config["ENV"] == "production":
+        config_file = "prod-config.yaml"
+
+    elif app.config["ENV"] == "development":
+        config_file = "dev-config.yaml"
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////" + str(REPO_FOLDER / "dev.db")
+        app.config["SECRET_KEY"] = "".join(random.choice(string.ascii_letters) for _ in range(32))
+
+    app.config.update(yaml.safe_load((REPO_FOLDER / config_file).open()))
+    app.secret_key = app.config["SECRET_KEY"]
+    db.init_app(app)
+    ma.init_app(app)
+    lib.configure_caches(
+        maxsize=app.config.get("CACHE_MAX_SIZE", lib.DEFAULT_CACHE_MAX_SIZE),
+        ttl=app.config.get("CACHE_TTL", lib.DEFAULT_CACHE_TTL),
     )
+    rendering.rendered_cache.configure(
+        maxsize=app.config.get("RENDERED_CACHE_MAX_SIZE", rendering.DEFAULT_RENDERED_CACHE_MAX_SIZE),
+        ttl=None,
+    )
+    return app
+
+
+def __getattr__(name: str) -> Any:
+    # creates the app on first access to wm_what.app.app
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    with _app_lock:
+        if "app" not in globals():
+            try:
+                globals()["app"] = create_app()
+            except Exception as error:
+                # an AttributeError would read as the module having no app
+                raise RuntimeError(f"Unable to create the app: {error}") from error
+
+    return globals()["app"]
 
 
 if __name__ == "__main__":
+    app = create_app()
     with app.app_context():
         app.run(port=5000)
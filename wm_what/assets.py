@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Fingerprinted and precompressed static files.
+
+utils/build_assets.py copies the files of wm_what/static with a hash of
+their content in the name, next to their compressed versions, and writes a
+manifest mapping the original names to the fingerprinted ones. When
+ASSETS_FOLDER points to the folder they were written to, the templates link
+to the fingerprinted files (see asset_url), served under /assets with a one
+year immutable cache, as any change gives them a new name. Without it they
+link to the plain /static files.
+"""
+import hashlib
+import json
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional
+
+import flask
+from flask import Flask
+
+from wm_what import compression
+from wm_what.paths import get_config_path
+
+MANIFEST_FILE_NAME = "manifest.json"
+HASH_LENGTH = 12
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+ENCODING_EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+def _fingerprint(path: Path, content: bytes) -> Path:
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    return path.with_name(f"{path.stem}.{digest}{path.suffix}")
+
+
+def build(static_folder: Path, output_folder: Path) -> Dict[str, str]:
+    """Write the fingerprinted and compressed files and the manifest, return the manifest."""
+    manifest = {}
+    for path in sorted(static_folder.rglob("*")):
+        if not path.is_file():
+            continue
+
+        content = path.read_bytes()
+        fingerprinted = _fingerprint(path.relative_to(static_folder), content)
+        target = output_folder / fingerprinted
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        if mimetypes.guess_type(path.name)[0] in compression.COMPRESSIBLE_MIMETYPES:
+            for encoding in compression.ENCODINGS:
+                compressed = compression.compress(content, encoding=encoding, best=True)
+                if len(compressed) < len(content):
+                    target.with_name(target.name + ENCODING_EXTENSIONS[encoding]).write_bytes(compressed)
+
+        manifest[path.relative_to(static_folder).as_posix()] = fingerprinted.as_posix()
+
+    (output_folder / MANIFEST_FILE_NAME).write_text(json.dumps(manifest, indent=4, sort_keys=True))
+    return manifest
+
+
+def _get_assets_folder() -> Optional[Path]:
+    return get_config_path(flask.current_app, "ASSETS_FOLDER")
+
+
+def _get_manifest() -> Dict[str, str]:
+    app = flask.current_app
+    if "wm_what_assets" not in app.extensions:
+        manifest = {}
+        assets_folder = _get_assets_folder()
+        if assets_folder is not None:
+            manifest_path = assets_folder / MANIFEST_FILE_NAME
+            if manifest_path.is_file():
+                manifest = json.loads(manifest_path.read_text())
+            else:
+                app.logger.warning(f"Missing {manifest_path}, serving the static files without fingerprints.")
+
+        app.extensions["wm_what_assets"] = manifest
+
+    return app.extensions["wm_what_assets"]
+
+
+def asset_url(filename: str) -> str:
+    """Url of the static file, the fingerprinted one if built."""
+    fingerprinted = _get_manifest().get(filename)
+    if fingerprinted is None:
+        return flask.url_for("static", filename=filename)
+
+    return flask.url_for("assets", filename=fingerprinted)
+
+
+def send_asset(filename: str) -> flask.Response:
+    assets_folder = _get_assets_folder()
+    if assets_folder is None:
+        flask.abort(404)
+
+    available_encodings = [
+        encoding
+        for encoding in compression.ENCODINGS
+        if (assets_folder / (filename + ENCODING_EXTENSIONS[encoding])).is_file()
+    ]
+    encoding = compression.get_accepted_encoding(available_encodings) if available_encodings else None
+    response = flask.send_from_directory(
+        assets_folder,
+        filename + ENCODING_EXTENSIONS[encoding] if encoding else filename,
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        max_age=IMMUTABLE_MAX_AGE,
+    )
+    response.cache_control.immutable = True
+    if available_encodings:
+        response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+
+    return response
+
+
+def init_app(app: Flask) -> None:
+    app.add_template_global(asset_url)
+    app.add_url_rule("/assets/<path:filename>", endpoint="assets", view_func=send_asset)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Small thread safe LRU cache with expiration, used to cache the lib reads.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """Least recently used cache, with an optional time to live for the entries.
+
+    Keeps hit, miss, eviction and expiration counters to help sizing it.
+
+    A value loaded while the key was invalidated could be older than the
+    change that invalidated it, so loads take a generation of the key before
+    loading and pass it to set, that drops the value if the key was
+    invalidated or set meanwhile. The generations are kept for up to maxsize
+    keys, past that they are all dropped with a new epoch, as clear does,
+    that only costs the loads running meanwhile their fill.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None) -> None:
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # bumped by clear, and per key by invalidate and the sets without generation
+        self._epoch = 0
+        self._generations: Dict[Hashable, int] = {}
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def configure(self, maxsize: int, ttl: Optional[float]) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._evict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_generation(self, key: Hashable) -> Tuple[int, int]:
+        """Take before loading the value of the key, to pass it to set."""
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def _bump(self, key: Hashable) -> None:
+        self._generations[key] = self._generations.get(key, 0) + 1
+        if len(self._generations) > self.maxsize:
+            self._epoch += 1
+            self._generations.clear()
+
+    def set(self, key: Hashable, value: Any, generation: Optional[Tuple[int, int]] = None) -> None:
+        """Store the value, unless the key changed since the generation was taken.
+
+        Without generation the value is taken as the newest one, ex. the one
+        just written, and the loads running meanwhile don't replace it.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            if generation is None:
+                self._bump(key)
+            elif generation != (self._epoch, self._generations.get(key, 0)):
+                return
+
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._bump(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+            self._generations.clear()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Compact read-only copy of the glossary, to answer the term lookups without the database.
+
+The whole glossary is packed in a single buffer: a header, a table of the
+terms sorted by name, a table of the definitions, and all the strings
+(names, authors, contents and timestamps, deduplicated) encoded after them,
+the tables referring to them by offset. Lookups binary search the terms
+table and build the same dicts TermSchema dumps, so nothing else is kept
+per term.
+
+The buffer can be written to a file and memory mapped, so the workers
+started afterwards don't build it again and share its pages. It is never
+modified, lib marks the terms changed since it was built as stale and looks
+them up in the database instead, see lib._get_compact_glossary.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+MAGIC = b"WMWHATC3"
+# magic, last change included, number of terms, number of definitions
+HEADER = struct.Struct("<8sqII")
+# name offset and length, index of the first definition, number of definitions
+TERM = struct.Struct("<IIII")
+# id, then the offset and length of the author, content, created and updated strings
+DEFINITION = struct.Struct("<qIIIIIIII")
+DEFINITION_STRING_FIELDS = ("author", "content", "created", "updated")
+
+
+class _StringsWriter:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, value: str) -> Tuple[int, int]:
+        if value not in self._offsets:
+            encoded = value.encode("utf-8")
+            self._offsets[value] = (len(self.buffer), len(encoded))
+            self.buffer += encoded
+
+        return self._offsets[value]
+
+
+def serialize(terms: Iterable[Dict[str, Any]], last_change: int) -> bytes:
+    """Pack the terms, as dumped by TermSchema, with the last change of the change log they include."""
+    strings = _StringsWriter()
+    # sorted by the encoded names, the order the lookups binary search in
+    sorted_terms = sorted(terms, key=lambda term: term["name"].encode("utf-8"))
+    term_table = bytearray()
+    definition_table = bytearray()
+    definition_count = 0
+    for term in sorted_terms:
+        term_table += TERM.pack(
+            *strings.add(term["name"]),
+            definition_count,
+            len(term["definitions"]),
+        )
+        for definition in term["definitions"]:
+            offsets = [offset for field in DEFINITION_STRING_FIELDS for offset in strings.add(definition[field])]
+            definition_table += DEFINITION.pack(definition["id"], *offsets)
+            definition_count += 1
+
+    header = HEADER.pack(MAGIC, last_change, len(sorted_terms), definition_count)
+    return b"".join((header, term_table, definition_table, strings.buffer))
+
+
+def write(path: Path, data: bytes) -> None:
+    """Replace the file atomically, the workers that mapped the previous one keep using it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, delete=False) as temp_file:
+        temp_file.write(data)
+    os.replace(temp_file.name, path)
+
+
+class CompactGlossary:
+    __slots__ = ("_buffer", "_definitions_start", "_strings_start", "last_change", "term_count", "definition_count")
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap]) -> None:
+        magic, self.last_change, self.term_count, self.definition_count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a compact glossary, got magic {magic!r}, expected {MAGIC!r}")
+
+        self._buffer = buffer
+        self._definitions_start = HEADER.size + TERM.size * self.term_count
+        self._strings_start = self._definitions_start + DEFINITION.size * self.definition_count
+
+    @classmethod
+    def open(cls, path: Path) -> "CompactGlossary":
+        with path.open("rb") as glossary_file:
+            return cls(mmap.mmap(glossary_file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def is_mapped(self) -> bool:
+        return isinstance(self._buffer, mmap.mmap)
+
+    def _string_bytes(self, offset: int, length: int) -> bytes:
+        start = self._strings_start + offset
+        return self._buffer[start : start + length]
+
+    def _string(self, offset: int, length: int) -> str:
+        return self._string_bytes(offset, length).decode("utf-8")
+
+    def _term_entry(self, index: int) -> Tuple[int, int, int, int]:
+        return TERM.unpack_from(self._buffer, HEADER.size + TERM.size * index)
+
+    def _find(self, name: str) -> Optional[int]:
+        encoded = name.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            name_offset, name_length, *_ = self._term_entry(middle)
+            if self._string_bytes(name_offset, name_length) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.term_count:
+            name_offset, name_length, *_ = self._term_entry(low)
+            if self._string_bytes(name_offset, name_length) == encoded:
+                return low
+
+        return None
+
+    def _definitions(self, first: int, count: int) -> List[Dict[str, Any]]:
+        definitions = []
+        for index in range(first, first + count):
+            definition_id, *offsets = DEFINITION.unpack_from(
+                self._buffer, self._definitions_start + DEFINITION.size * index
+            )
+            definition: Dict[str, Any] = {"id": definition_id}
+            for field_index, field in enumerate(DEFINITION_STRING_FIELDS):
+                definition[field] = self._string(offsets[field_index * 2], offsets[field_index * 2 + 1])
+            # the same few authors repeat a lot
+            definition["author"] = sys.intern(definition["author"])
+            definitions.append(definition)
+
+        return definitions
+
+    def __contains__(self, name: str) -> bool:
+        return self._find(name) is not None
+
+    def get_term(self, name: str) -> Optional[Dict[str, Any]]:
+        index = self._find(name)
+        if index is None:
+            return None
+
+        _, _, first_definition, definition_count = self._term_entry(index)
+        return {"name": name, "definitions": self._definitions(first_definition, definition_count)}
+
+    def iter_names(self) -> Iterator[str]:
+        for index in range(self.term_count):
+            name_offset, name_length, *_ = self._term_entry(index)
+            yield self._string(name_offset, name_length)
+
+
+class CompactGlossaryStore:
+    """The compact glossary a worker serves from, and the names of the terms changed since it was built."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.glossary: Optional[CompactGlossary] = None
+        # (inode, modification time) of the file it was mapped from
+        self.file_id: Optional[Tuple[int, int]] = None
+        # last change already marked as stale
+        self.seen_change = 0
+        self._stale_names: Set[str] = set()
+        self._checked_at = float("-inf")
+
+    def load(self, glossary: CompactGlossary, file_id: Optional[Tuple[int, int]] = None) -> None:
+        with self._lock:
+            self.glossary = glossary
+            self.file_id = file_id
+            self.seen_change = glossary.last_change
+            self._stale_names = set()
+
+    def mark_stale(self, names: Iterable[str], seen_change: Optional[int] = None) -> None:
+        with self._lock:
+            self._stale_names.update(names)
+            if seen_change is not None:
+                self.seen_change = max(self.seen_change, seen_change)
+                self._checked_at = time.monotonic()
+
+    def is_fresh(self, name: str) -> bool:
+        """Whether the term is the same in the glossary as in the database, including not existing in either."""
+        return name not in self._stale_names
+
+    def needs_check(self, max_age: float) -> bool:
+        return self.glossary is None or time.monotonic() - self._checked_at > max_age
+
+    @property
+    def stale_count(self) -> int:
+        return len(self._stale_names)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.glossary = None
+            self.file_id = None
+            self._stale_names = set()
+            self._checked_at = float("-inf")
+
+    def stats(self) -> Dict[str, Any]:
+        glossary = self.glossary
+        if glossary is None:
+            return {"loaded": False}
+
+        return {
+            "loaded": True,
+            "mapped": glossary.is_mapped,
+            "size": glossary.size,
+            "terms": glossary.term_count,
+            "definitions": glossary.definition_count,
+            "last_change": glossary.last_change,
+            "stale_terms": self.stale_count,
+        }
+
+
+def get_file_id(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_mtime_ns
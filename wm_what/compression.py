@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Negotiated compression of the responses, brotli when installed, gzip otherwise.
+
+Only the JSON, HTML and other text responses of at least
+COMPRESSION_MIN_SIZE bytes are compressed, smaller ones are not worth the
+cpu. Streamed responses (the export) and files are left as they are, the
+static files can be precompressed instead, see wm_what.assets.
+"""
+import gzip
+from typing import Iterable, Optional
+
+import flask
+from flask import Flask
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+# levels for the responses, fast enough to do on each request
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# levels for the files compressed once, at build time
+BEST_GZIP_LEVEL = 9
+BEST_BROTLI_QUALITY = 11
+
+# preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+COMPRESSIBLE_MIMETYPES = {
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+    "image/svg+xml",
+    "image/vnd.microsoft.icon",
+    "image/x-icon",
+    "text/css",
+    "text/csv",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BEST_BROTLI_QUALITY if best else BROTLI_QUALITY)
+
+    if encoding == "gzip":
+        # no timestamp, so the output only depends on the data
+        return gzip.compress(data, compresslevel=BEST_GZIP_LEVEL if best else GZIP_LEVEL, mtime=0)
+
+    raise ValueError(f"Unknown encoding {encoding}, known: {', '.join(ENCODINGS)}")
+
+
+def get_accepted_encoding(encodings: Iterable[str] = ENCODINGS) -> Optional[str]:
+    """Return the encoding the client prefers among the given ones, None if it accepts none."""
+    return flask.request.accept_encodings.best_match(list(encodings))
+
+
+def _compress_response(response: flask.Response) -> flask.Response:
+    if (
+        not flask.current_app.config.get("COMPRESS_RESPONSES", True)
+        or response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    # the body depends on the header even when not compressing, as it could be for a bigger one
+    response.vary.add("Accept-Encoding")
+    min_size = flask.current_app.config.get("COMPRESSION_MIN_SIZE", DEFAULT_COMPRESSION_MIN_SIZE)
+    if (response.content_length or 0) < min_size:
+        return response
+
+    encoding = get_accepted_encoding()
+    if encoding is None:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding=encoding))
+    response.headers["Content-Encoding"] = encoding
+    # the compressed body is not byte by byte the same as the uncompressed one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def init_app(app: Flask) -> None:
+    app.after_request(_compress_response)
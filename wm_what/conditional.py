@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Conditional GET support, answers with 304 when the client copy is still valid.
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+import flask
+
+
+def _is_not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    # If-None-Match takes precedence when both are sent, see rfc7232 section 6,
+    # and uses the weak comparison
+    if flask.request.if_none_match:
+        return flask.request.if_none_match.contains_weak(etag)
+
+    if last_modified and flask.request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= flask.request.if_modified_since
+
+    return False
+
+
+def conditional_response(
+    etag: str, last_modified: Optional[datetime], make_body: Callable[[], Any], private: bool = False
+) -> flask.Response:
+    """Return a 304 if the client has the current version, the response from make_body otherwise.
+
+    make_body is only called when the full response is needed, so the
+    serialization and rendering are skipped for 304s. Responses that vary per
+    user (pages showing the logged in user) should be private.
+    """
+    if last_modified is not None and last_modified.tzinfo is None:
+        # the db timestamps are in UTC
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+
+    if _is_not_modified(etag=etag, last_modified=last_modified):
+        response = flask.Response(status=304)
+    else:
+        response = flask.make_response(make_body())
+        if response.status_code != 200:
+            return response
+
+    # weak, the etags are derived from the data shown, not from the bytes sent
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    # always revalidate, that is cheap and avoids serving stale definitions
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+
+    return response
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Faster encoding of the JSON responses, with orjson when installed.
+
+Flask encodes the dicts returned by the views with the stdlib json module,
+that dominates the cost of the big responses (listings, explain). The
+provider set here hands them to orjson instead for the compact output (not
+in debug mode nor with app.json.compact set to False), escaping the non
+ASCII characters as the stdlib does when app.json.ensure_ascii is set, and
+passing the dates and dataclasses to the Flask default function, so the
+responses are the same bytes. The only difference is in the floats, that
+can be written in another notation for the same value (ex. 0.00001 for
+1e-05), and NaN and infinity, written as null. Anything orjson can not
+encode (big ints, non string keys, lone surrogates...) falls back to the
+stdlib.
+"""
+import re
+from typing import Any
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+# the stdlib escapes DEL too when ensuring ASCII
+_NOT_ASCII = re.compile("[\x7f-\U0010ffff]")
+# the json.dumps arguments the orjson encoding supports
+_FAST_ARGUMENTS = {"separators", "default", "ensure_ascii", "sort_keys"}
+
+
+def _escape(match: re.Match) -> str:
+    code = ord(match.group())
+    if code < 0x10000:
+        return f"\\u{code:04x}"
+
+    # as a surrogate pair, like the stdlib
+    code -= 0x10000
+    return f"\\u{0xD800 | (code >> 10):04x}\\u{0xDC00 | (code & 0x3FF):04x}"
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def _uses_deprecated_config(self) -> bool:
+        # the JSON_* keys flask 2.2 still honours over the attributes
+        return any(self._app.config.get(key) is not None for key in ("JSON_AS_ASCII", "JSON_SORT_KEYS"))
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        is_compact = kwargs.get("separators") == (",", ":") and kwargs.keys() <= _FAST_ARGUMENTS
+        if orjson is None or not is_compact or self._uses_deprecated_config():
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            encoded = orjson.dumps(obj, default=kwargs.get("default", self.default), option=option).decode("utf-8")
+        except (orjson.JSONEncodeError, TypeError):
+            return super().dumps(obj, **kwargs)
+
+        if kwargs.get("ensure_ascii", self.ensure_ascii) and (not encoded.isascii() or "\x7f" in encoded):
+            return _NOT_ASCII.sub(_escape, encoded)
+
+        return encoded
+
+
+def init_app(app: Flask) -> None:
+    app.json_provider_class = FastJSONProvider
+    # Flask() created app.json from the class already
+    app.json = app.json_provider_class(app)
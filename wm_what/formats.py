@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+File formats used to export and import the whole glossary.
+
+Imported rows use the same shape as the exported terms, a dict with the term
+`name` and a list of `definitions`, each with `author` and `content`.
+"""
+import csv
+import io
+import json
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, Tuple, Union
+
+CSV_FIELDS = ["term_name", "id", "author", "content", "created", "updated"]
+
+
+def to_ndjson(terms: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """One json object per term, with all its definitions."""
+    for term in terms:
+        yield json.dumps(term) + "\n"
+
+
+def to_csv(terms: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """One row per definition, terms without definitions get a row with only the name."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for term in terms:
+        rows = [{"term_name": term["name"], **definition} for definition in term["definitions"]]
+        writer.writerows(rows or [{"term_name": term["name"]}])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+# format name -> (mimetype, writer)
+EXPORT_FORMATS: Dict[str, Tuple[str, Callable[[Iterable[Dict[str, Any]]], Iterator[str]]]] = {
+    "ndjson": ("application/x-ndjson", to_ndjson),
+    "csv": ("text/csv", to_csv),
+}
+
+
+def from_ndjson(stream: IO[str]) -> Iterator[Union[Dict[str, Any], ValueError]]:
+    """Lines that are not valid json are returned as the error, to be reported with the rest."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+
+        try:
+            yield json.loads(line)
+        except ValueError as error:
+            yield ValueError(f"Invalid json on line {line_number}: {error}")
+
+
+def from_json(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Either a list of terms, or an object with them under `terms`."""
+    data = json.load(stream)
+    if isinstance(data, dict):
+        data = data.get("terms", [])
+
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of terms, or an object with them under `terms`.")
+
+    yield from data
+
+
+def from_csv(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    """Same columns as the export, only term_name is required, author and content for the definition."""
+    reader = csv.DictReader(stream)
+    try:
+        for row in reader:
+            definitions = []
+            if row.get("content"):
+                definitions.append({"author": row.get("author"), "content": row["content"]})
+
+            yield {"name": row.get("term_name"), "definitions": definitions}
+    except csv.Error as error:
+        # like the invalid json, ex. a field over the csv module size limit
+        raise ValueError(f"Invalid csv after line {reader.line_num}: {error}") from error
+
+
+IMPORT_FORMATS: Dict[str, Callable[[IO[str]], Iterator[Any]]] = {
+    "ndjson": from_ndjson,
+    "json": from_json,
+    "csv": from_csv,
+}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Typo tolerant lookup of term names, for the "did you mean" suggestions.
+"""
+from typing import Dict, Iterator, List, Set, Tuple, Union
+
+from wm_what.indexes import NameIndex
+
+# one insertion, deletion, substitution or swap of two adjacent characters
+MAX_DISTANCE = 1
+
+# most variants and lowercase names map to a single name, so that is stored
+# as is, without a container, the few shared ones as a list
+_Names = Union[str, List[str]]
+
+
+def edit_distance(first: str, second: str) -> int:
+    """Optimal string alignment distance, levenshtein counting adjacent swaps as one edit."""
+    previous_row: List[int] = []
+    row = list(range(len(second) + 1))
+    for first_index, first_char in enumerate(first, start=1):
+        previous_previous_row, previous_row = previous_row, row
+        row = [first_index] + [0] * len(second)
+        for second_index, second_char in enumerate(second, start=1):
+            cost = 0 if first_char == second_char else 1
+            row[second_index] = min(
+                previous_row[second_index] + 1,
+                row[second_index - 1] + 1,
+                previous_row[second_index - 1] + cost,
+            )
+            if (
+                first_index > 1
+                and second_index > 1
+                and first_char == second[second_index - 2]
+                and first[first_index - 2] == second_char
+            ):
+                row[second_index] = min(row[second_index], previous_previous_row[second_index - 2] + 1)
+
+    return row[-1]
+
+
+def _variants(word: str) -> Iterator[str]:
+    yield word
+    for position in range(len(word)):
+        yield word[:position] + word[position + 1 :]
+
+
+def _add_name(names: Dict[str, _Names], key: str, name: str) -> None:
+    current = names.get(key)
+    if current is None:
+        names[key] = name
+    elif isinstance(current, str):
+        names[key] = [current, name]
+    else:
+        current.append(name)
+
+
+def _as_list(names: _Names) -> List[str]:
+    return [names] if isinstance(names, str) else names
+
+
+class FuzzyIndex(NameIndex):
+    """Case insensitive deletion dictionary (SymSpell like) over the names.
+
+    Every name is indexed under itself and all the strings that result from
+    deleting one of its characters. Any name within one edit of a query shares
+    at least one of those with the query's own variants, so a lookup only
+    checks the distance to a handful of candidates instead of every name.
+    There are about as many variants as characters in the names, so they are
+    stored without a set per variant, see `_Names`.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # lowercase name -> original names
+        self._names: Dict[str, _Names] = {}
+        # variant -> lowercase names
+        self._variants: Dict[str, _Names] = {}
+
+    def _clear(self) -> None:
+        self._names = {}
+        self._variants = {}
+
+    def _add(self, name: str) -> None:
+        lower_name = name.lower()
+        known_names = self._names.get(lower_name)
+        if known_names is None:
+            # deleting either of two repeated characters gives the same variant
+            for variant in dict.fromkeys(_variants(lower_name)):
+                _add_name(self._variants, variant, lower_name)
+        elif name in _as_list(known_names):
+            return
+
+        _add_name(self._names, lower_name, name)
+
+    def similar(self, query: str, limit: int) -> List[str]:
+        """Return up to limit names within MAX_DISTANCE edits of the query, closest first."""
+        query = query.lower()
+        with self._lock:
+            candidates: Set[str] = set()
+            for variant in _variants(query):
+                candidates.update(_as_list(self._variants.get(variant, [])))
+
+            matches: List[Tuple[int, str, str]] = []
+            for candidate in candidates:
+                distance = edit_distance(query, candidate)
+                if distance <= MAX_DISTANCE:
+                    matches.extend((distance, candidate, name) for name in _as_list(self._names[candidate]))
+
+        return [name for _, _, name in sorted(matches)[:limit]]
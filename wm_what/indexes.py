@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+In-memory indexes over the term names.
+
+They are loaded from the database the first time they are used, kept up to
+date by the write functions in `wm_what.lib`, and updated with the terms
+created by other workers from the change log, checked once the configured
+max age passes.
+"""
+import bisect
+import heapq
+import itertools
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# terms are short acronyms, so up to trigrams gives very selective postings
+NGRAM_SIZE = 3
+# how many candidates cost as much to page through as scanning one name
+SCAN_COST = 4
+
+
+class NameIndex(ABC):
+    """Base class for the term name indexes.
+
+    Subclasses implement `_clear` and `_add`, this class takes care of the
+    locking and of tracking when the index was loaded. Terms are never
+    deleted, so the names are never removed from the indexes.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._checked_at: Optional[float] = None
+        # last change of the change log included
+        self.seen_change = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._checked_at is not None
+
+    def needs_check(self, max_age: Optional[float]) -> bool:
+        """Whether it's time to look for the names added since the last check."""
+        return self._checked_at is not None and max_age is not None and time.monotonic() - self._checked_at > max_age
+
+    def invalidate(self) -> None:
+        """Force reloading the index on next use."""
+        with self._lock:
+            self._checked_at = None
+
+    def _mark_checked(self, seen_change: int) -> None:
+        self._checked_at = time.monotonic()
+        self.seen_change = max(self.seen_change, seen_change)
+
+    def load(self, names: Iterable[str], seen_change: int = 0) -> None:
+        with self._lock:
+            self._clear()
+            for name in names:
+                self._add(name)
+
+            self.seen_change = 0
+            self._mark_checked(seen_change)
+
+    def update(self, names: Iterable[str], seen_change: int) -> None:
+        """Add the names created up to the seen_change change."""
+        with self._lock:
+            for name in names:
+                self._add(name)
+
+            self._mark_checked(seen_change)
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            self._add(name)
+
+    @abstractmethod
+    def _clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def _add(self, name: str) -> None:
+        pass
+
+
+def _ngrams(text: str) -> Set[str]:
+    return {text[start : start + size] for size in range(1, NGRAM_SIZE + 1) for start in range(len(text) - size + 1)}
+
+
+class SubstringIndex(NameIndex):
+    """Case insensitive n-gram inverted index for substring searches.
+
+    Every name is indexed by all its 1, 2 and 3 character grams, so queries up
+    to NGRAM_SIZE characters are answered straight from a posting list, and
+    longer ones by intersecting the postings of their trigrams and checking
+    only the few candidates left. The names are also kept sorted, to page
+    through the matches of the common queries without collecting them all.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._names: Set[str] = set()
+        # sorted lazily, as the names are added one by one when loading
+        self._sorted_names: List[str] = []
+        self._is_sorted = True
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _clear(self) -> None:
+        self._postings = defaultdict(set)
+        self._names = set()
+        self._sorted_names = []
+        self._is_sorted = True
+
+    def _add(self, name: str) -> None:
+        if name in self._names:
+            return
+
+        self._names.add(name)
+        self._sorted_names.append(name)
+        self._is_sorted = False
+        for gram in _ngrams(name.lower()):
+            self._postings[gram].add(name)
+
+    def _candidates(self, query: str) -> Set[str]:
+        if not query:
+            return set(self._names)
+
+        if len(query) <= NGRAM_SIZE:
+            return set(self._postings.get(query, ()))
+
+        trigrams = sorted(
+            (query[start : start + NGRAM_SIZE] for start in range(len(query) - NGRAM_SIZE + 1)),
+            key=lambda gram: len(self._postings.get(gram, ())),
+        )
+        candidates = set(self._postings.get(trigrams[0], ()))
+        for gram in trigrams[1:]:
+            if not candidates:
+                break
+            candidates &= self._postings.get(gram, set())
+
+        return {name for name in candidates if query in name.lower()}
+
+    def _max_candidates(self, query: str) -> int:
+        if not query:
+            return len(self._names)
+
+        if len(query) <= NGRAM_SIZE:
+            return len(self._postings.get(query, ()))
+
+        return min(
+            len(self._postings.get(query[start : start + NGRAM_SIZE], ()))
+            for start in range(len(query) - NGRAM_SIZE + 1)
+        )
+
+    def matches(self, query: str) -> Set[str]:
+        """Return the unordered set of names containing the query."""
+        with self._lock:
+            return self._candidates(query.lower())
+
+    def count(self, query: str) -> int:
+        """Return the number of names containing the query, without collecting them for the short queries."""
+        query = query.lower()
+        with self._lock:
+            if len(query) <= NGRAM_SIZE:
+                return self._max_candidates(query)
+
+            return len(self._candidates(query))
+
+    def page(self, query: str, after: Optional[str] = None, limit: int = 100) -> List[str]:
+        """Return up to limit names containing the query, sorted, that go after the given one.
+
+        The matches of a selective query are taken from its candidates, the
+        ones of a common query by scanning the sorted names from the cursor,
+        stopping once the page is full, whichever is expected to be cheaper.
+        That's never more than sqrt(SCAN_COST * limit * names) steps, however
+        many names match.
+        """
+        query = query.lower()
+        with self._lock:
+            max_candidates = self._max_candidates(query)
+            # the matches show up in the scan at the rate they are among all the names
+            expected_scan = limit * len(self._names) / max(max_candidates, 1)
+            if max_candidates <= expected_scan * SCAN_COST:
+                candidates = self._candidates(query)
+                return heapq.nsmallest(limit, (name for name in candidates if after is None or name > after))
+
+            if not self._is_sorted:
+                self._sorted_names.sort()
+                self._is_sorted = True
+
+            names: List[str] = []
+            start = bisect.bisect_right(self._sorted_names, after) if after is not None else 0
+            for name in itertools.islice(self._sorted_names, start, None):
+                if query in name.lower():
+                    names.append(name)
+                    if len(names) == limit:
+                        break
+
+            return names
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """Return the names containing the query, ranked exact > prefix > substring.
+
+        Names with the same rank are sorted alphabetically.
+        """
+        query = query.lower()
+        candidates = self.matches(query)
+
+        def _rank(name: str) -> Tuple[int, str, str]:
+            lower_name = name.lower()
+            if lower_name == query:
+                return (0, lower_name, name)
+            if lower_name.startswith(query):
+                return (1, lower_name, name)
+            return (2, lower_name, name)
+
+        if limit:
+            return heapq.nsmallest(limit, candidates, key=_rank)
+
+        return sorted(candidates, key=_rank)
+
+
+class PrefixIndex(NameIndex):
+    """Case insensitive sorted array of the names, for prefix completions.
+
+    Lookups are a binary search plus the number of results returned.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # (lowercase name, name) pairs, sorted
+        self._entries: List[Tuple[str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _clear(self) -> None:
+        self._entries = []
+
+    def load(self, names: Iterable[str], seen_change: int = 0) -> None:
+        # faster than inserting them one by one
+        entries = sorted({(name.lower(), name) for name in names})
+        with self._lock:
+            self._entries = entries
+            self.seen_change = 0
+            self._mark_checked(seen_change)
+
+    def _add(self, name: str) -> None:
+        entry = (name.lower(), name)
+        position = bisect.bisect_left(self._entries, entry)
+        if position == len(self._entries) or self._entries[position] != entry:
+            self._entries.insert(position, entry)
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """Return up to limit names starting with the prefix, alphabetically, so an exact match goes first."""
+        prefix = prefix.lower()
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (prefix, ""))
+            entries = self._entries[position : position + limit]
+
+        return [name for lower_name, name in entries if lower_name.startswith(prefix)]
@@ -1,9 +1,105 @@
 #!/usr/bin/env python3
-from typing import Any, Dict, Optional
-
-from requests.models import HTTPError
-
-from wm_what.models import Definition, DefinitionSchema, Term, TermSchema, db
+import functools
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    cast,
+)
+
+from flask import current_app
+from sqlalchemy import and_, func, insert, or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from wm_what import compact, serializers
+from wm_what.cache import LRUCache
+from wm_what.compact import CompactGlossary, CompactGlossaryStore
+from wm_what.fuzzy import FuzzyIndex
+from wm_what.indexes import NameIndex, PrefixIndex, SubstringIndex
+from wm_what.matcher import TermMatcher
+from wm_what.metrics import CallbackMetric, measure_serialization, register
+from wm_what.models import (
+    Change,
+    ChangeSchema,
+    Definition,
+    DefinitionSchema,
+    Term,
+    TermSchema,
+    db,
+    normalize_name,
+)
+from wm_what.paths import get_config_path
+from wm_what.rendering import render_definition, rendered_cache
+from wm_what.routing import replica_reads, sticks_to_primary
+from wm_what.singleflight import SingleFlight
+
+# seconds between the checks of the change log for the terms added by other
+# workers, to add them to the in-memory name indexes
+DEFAULT_TERM_INDEX_MAX_AGE = 30
+
+term_search_index = SubstringIndex()
+term_matcher = TermMatcher()
+term_prefix_index = PrefixIndex()
+term_fuzzy_index = FuzzyIndex()
+NAME_INDEXES = (term_search_index, term_matcher, term_prefix_index, term_fuzzy_index)
+_name_indexes_lock = threading.Lock()
+# the requests arriving while an index is first loaded wait for that load,
+# instead of each reading all the names
+name_index_flights = SingleFlight()
+
+IndexType = TypeVar("IndexType", bound=NameIndex)
+FunctionType = TypeVar("FunctionType", bound=Callable[..., Any])
+
+DEFAULT_CACHE_MAX_SIZE = 1024
+# seconds, bounds how long other workers can serve stale entries
+DEFAULT_CACHE_TTL = 30
+# entries are the term dicts by name, the definition dicts by id, and the
+# unfiltered name listings (splash examples) by limit
+term_cache = LRUCache(maxsize=DEFAULT_CACHE_MAX_SIZE, ttl=DEFAULT_CACHE_TTL)
+definition_cache = LRUCache(maxsize=DEFAULT_CACHE_MAX_SIZE, ttl=DEFAULT_CACHE_TTL)
+term_names_cache = LRUCache(maxsize=16, ttl=DEFAULT_CACHE_TTL)
+# the concurrent cache misses for the same term or definition share a single
+# query, keyed like the caches
+term_flights = SingleFlight()
+definition_flights = SingleFlight()
+
+# seconds between the checks of the change log for the terms changed since
+# the compact glossary was built, when serving from it
+DEFAULT_COMPACT_GLOSSARY_MAX_AGE = 30
+# changed terms after which the compact glossary is built again, instead of
+# looking them up in the database
+DEFAULT_COMPACT_GLOSSARY_MAX_STALE = 1000
+compact_glossary = CompactGlossaryStore()
+_compact_glossary_lock = threading.Lock()
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+DEFAULT_SIMILAR_NAMES = 5
+
+# seconds a change waits before it's served by the change log, longer than
+# the writes take to commit, see get_changes_page
+DEFAULT_CHANGES_SETTLE_SECONDS = 10
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+IMPORT_CHUNK_SIZE = 1000
+# names per query when loading terms by name
+TERMS_CHUNK_SIZE = 1000
+IMPORT_DUPLICATE_ACTIONS = ("skip", "merge")
 
 
 class NotFound(Exception):
@@ -14,101 +110,884 @@ class Unauthorized(Exception):
     pass
 
 
-def get_terms(name_filter: Optional[str] = None, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
-    if name_filter is None:
-        query = db.session.query(Term)
+class InvalidRow(Exception):
+    pass
+
+
+class AlreadyExists(Exception):
+    pass
+
+
+def _reads_from_replica(function: FunctionType) -> FunctionType:
+    """Run the queries of the function on a replica, see wm_what.routing."""
+
+    @functools.wraps(function)
+    def _wrapper(*args, **kwargs):
+        with replica_reads(db.session):
+            return function(*args, **kwargs)
+
+    return cast(FunctionType, _wrapper)
+
+
+def configure_caches(maxsize: int = DEFAULT_CACHE_MAX_SIZE, ttl: Optional[float] = DEFAULT_CACHE_TTL) -> None:
+    term_cache.configure(maxsize=maxsize, ttl=ttl)
+    definition_cache.configure(maxsize=maxsize, ttl=ttl)
+    term_names_cache.configure(maxsize=term_names_cache.maxsize, ttl=ttl)
+
+
+def clear_caches() -> None:
+    """Drop all the cached data, ex. after changing the database under the app."""
+    term_cache.clear()
+    definition_cache.clear()
+    term_names_cache.clear()
+    for index in NAME_INDEXES:
+        index.invalidate()
+    compact_glossary.invalidate()
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "term": term_cache.stats(),
+        "definition": definition_cache.stats(),
+        "term_names": term_names_cache.stats(),
+        "rendered_markdown": rendered_cache.stats(),
+    }
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {
+        "term": term_flights.stats(),
+        "definition": definition_flights.stats(),
+        "name_index": name_index_flights.stats(),
+    }
+
+
+def _forget_term_lookups(*term_names: str) -> None:
+    # the loads running already and the compact glossary might miss the change
+    for term_name in term_names:
+        term_flights.forget(term_name)
+    compact_glossary.mark_stale(term_names)
+
+
+def _invalidate_terms(*term_names: str) -> None:
+    for term_name in term_names:
+        term_cache.invalidate(term_name)
+    _forget_term_lookups(*term_names)
+
+
+def _invalidate_definition(id: int) -> None:
+    definition_cache.invalidate(str(id))
+    definition_flights.forget(str(id))
+
+
+def _cache_definition(definition: Dict[str, Any]) -> None:
+    definition_cache.set(str(definition["id"]), definition)
+    definition_flights.forget(str(definition["id"]))
+
+
+def _load_into_cache(cache: LRUCache, key: Hashable, load: Callable[[], Any]) -> Any:
+    # taken before loading, the cache drops the value if a write invalidated the key meanwhile
+    generation = cache.get_generation(key)
+    value = load()
+    cache.set(key, value, generation=generation)
+    return value
+
+
+def _get_cache_stat(stat_name: str) -> Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]:
+    return lambda: {(("cache", cache_name),): stats[stat_name] for cache_name, stats in get_cache_stats().items()}
+
+
+for _stat_name in ("hits", "misses", "evictions", "expirations"):
+    register(
+        CallbackMetric(
+            name=f"wm_what_cache_{_stat_name}_total",
+            description=f"Cache {_stat_name}, by cache.",
+            metric_type="counter",
+            get_values=_get_cache_stat(_stat_name),
+        )
+    )
+register(
+    CallbackMetric(
+        name="wm_what_cache_size",
+        description="Entries in the cache, by cache.",
+        metric_type="gauge",
+        get_values=_get_cache_stat("size"),
+    )
+)
+
+
+def _get_single_flight_stat(stat_name: str) -> Callable[[], Dict[Tuple[Tuple[str, str], ...], float]]:
+    return lambda: {(("lookup", lookup),): stats[stat_name] for lookup, stats in get_single_flight_stats().items()}
+
+
+register(
+    CallbackMetric(
+        name="wm_what_single_flight_calls_total",
+        description="Lookups that ran their query, by lookup.",
+        metric_type="counter",
+        get_values=_get_single_flight_stat("calls"),
+    )
+)
+register(
+    CallbackMetric(
+        name="wm_what_single_flight_coalesced_total",
+        description="Lookups that waited for the same one already running instead, by lookup.",
+        metric_type="counter",
+        get_values=_get_single_flight_stat("coalesced"),
+    )
+)
+
+
+def _load_name_index(index: NameIndex) -> None:
+    # a load that just finished is no longer shared, so the late callers check again
+    if index.loaded:
+        return
+
+    # taken before reading the names, the terms created meanwhile get added by the next check
+    seen_change = get_last_change_seq()
+    index.load((name for (name,) in db.session.query(Term.name)), seen_change=seen_change)
+
+
+def _get_name_index(index: IndexType) -> IndexType:
+    if not index.loaded:
+        name_index_flights.do(index, lambda: _load_name_index(index))
+        return index
+
+    max_age = current_app.config.get("TERM_INDEX_MAX_AGE", DEFAULT_TERM_INDEX_MAX_AGE)
+    # one thread checks, the others keep using the index as it is
+    if index.needs_check(max_age) and _name_indexes_lock.acquire(blocking=False):
+        try:
+            if index.needs_check(max_age):
+                # terms are never removed, so adding the changed ones is enough
+                names, seen_change = get_changed_term_names(since=index.seen_change)
+                index.update(names, seen_change=seen_change)
+        finally:
+            _name_indexes_lock.release()
+
+    return index
+
+
+def _index_term_name(term_name: str) -> None:
+    for index in NAME_INDEXES:
+        # the ones not loaded yet will get it from the db when loading
+        if index.loaded:
+            index.add(term_name)
+
+
+def get_compact_glossary_path() -> Optional[Path]:
+    """The file the compact glossary is mapped from, None to keep it in memory only."""
+    return get_config_path(current_app, "COMPACT_GLOSSARY_FILE")
+
+
+def build_compact_glossary(path: Optional[Path] = None) -> CompactGlossary:
+    """Build the compact glossary from the database, written to path and mapped from it if passed."""
+    # taken before reading the terms, the changes made meanwhile get marked as stale
+    last_change = get_last_change_seq()
+    data = compact.serialize(iter_terms(), last_change=last_change)
+    if path is None:
+        return CompactGlossary(data)
+
+    compact.write(path, data)
+    return CompactGlossary.open(path)
+
+
+def _load_compact_glossary(path: Optional[Path], rebuild: bool = False) -> None:
+    file_id = compact.get_file_id(path) if path else None
+    if rebuild or (compact_glossary.glossary is None and file_id is None):
+        glossary = build_compact_glossary(path)
+        compact_glossary.load(glossary, file_id=compact.get_file_id(path) if path else None)
+    elif path is not None and file_id is not None and file_id != compact_glossary.file_id:
+        # new workers start from the file, and pick up the ones built by
+        # other workers or utils/build_compact_glossary.py
+        try:
+            glossary = CompactGlossary.open(path)
+        except ValueError:
+            # written by a previous version, in another format
+            glossary = build_compact_glossary(path)
+            file_id = compact.get_file_id(path)
+        compact_glossary.load(glossary, file_id=file_id)
+
+
+def _refresh_compact_glossary() -> None:
+    path = get_compact_glossary_path()
+    _load_compact_glossary(path)
+    max_stale = current_app.config.get("COMPACT_GLOSSARY_MAX_STALE", DEFAULT_COMPACT_GLOSSARY_MAX_STALE)
+    changed_names: Set[str] = set()
+    since = compact_glossary.seen_change
+    has_more = True
+    while has_more and compact_glossary.stale_count + len(changed_names) <= max_stale:
+        changes, since, has_more = get_changes_page(since=since, limit=MAX_PAGE_SIZE)
+        changed_names.update(change["term_name"] for change in changes)
+
+    if compact_glossary.stale_count + len(changed_names) > max_stale:
+        _load_compact_glossary(path, rebuild=True)
+        compact_glossary.mark_stale((), seen_change=compact_glossary.seen_change)
+    else:
+        compact_glossary.mark_stale(changed_names, seen_change=since)
+
+
+def _get_compact_glossary() -> Optional[CompactGlossary]:
+    """The compact glossary, when serving from it is enabled with COMPACT_GLOSSARY, see wm_what.compact."""
+    if not current_app.config.get("COMPACT_GLOSSARY"):
+        return None
+
+    max_age = current_app.config.get("COMPACT_GLOSSARY_MAX_AGE", DEFAULT_COMPACT_GLOSSARY_MAX_AGE)
+    if compact_glossary.needs_check(max_age):
+        # one thread refreshes it, the others keep using the current one
+        if _compact_glossary_lock.acquire(blocking=compact_glossary.glossary is None):
+            try:
+                if compact_glossary.needs_check(max_age):
+                    _refresh_compact_glossary()
+            finally:
+                _compact_glossary_lock.release()
+
+    return compact_glossary.glossary
+
+
+def _get_compact_term(name: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """Return whether the compact glossary has the current version of the term, and the term if it exists."""
+    glossary = _get_compact_glossary()
+    if glossary is None or not compact_glossary.is_fresh(name):
+        return False, None
+
+    return True, glossary.get_term(name)
+
+
+@_reads_from_replica
+def get_terms(name_filter: Optional[str] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    # ranked exact > prefix > substring match when filtering
+    names = get_term_names(name_filter=name_filter, limit=limit)
+    if _get_compact_glossary() is not None:
+        terms_by_name = get_terms_by_name(names)
     else:
-        query = db.session.query(Term).filter(Term.name.like(f"%{name_filter}%"))
+        terms_by_name = _load_terms_by_name(names)
+
+    return [terms_by_name[name] for name in names if name in terms_by_name]
+
+
+def _load_terms_by_name(names: List[str]) -> Dict[str, Dict[str, Any]]:
+    terms: Dict[str, Dict[str, Any]] = {}
+    for start in range(0, len(names), TERMS_CHUNK_SIZE):
+        query = serializers.select_terms().filter(Term.name.in_(names[start : start + TERMS_CHUNK_SIZE]))
+        rows = db.session.execute(query)
+        with measure_serialization():
+            terms.update((term["name"], term) for term in serializers.dump_terms(rows))
 
+    return terms
+
+
+@_reads_from_replica
+def get_term_names(name_filter: Optional[str] = None, limit: Optional[int] = None) -> List[str]:
+    """Same as get_terms, but returning only the names, without loading any definitions."""
+    if name_filter is not None:
+        return _get_name_index(term_search_index).search(name_filter, limit=limit)
+
+    names = term_names_cache.get(limit)
+    if names is not None:
+        return names
+
+    generation = term_names_cache.get_generation(limit)
+    query = db.session.query(Term.name)
     if limit:
         query = query.limit(limit)
 
-    term_schema = TermSchema(many=True)
-    return term_schema.dump(query.all())
+    names = [name for (name,) in query]
+    if limit:
+        term_names_cache.set(limit, names, generation=generation)
+
+    return names
+
+
+@_reads_from_replica
+def suggest_term_names(prefix: str, limit: int = DEFAULT_SUGGESTIONS) -> List[str]:
+    """Get the term names starting with prefix, case insensitive, from memory."""
+    return _get_name_index(term_prefix_index).complete(prefix, limit=limit)
+
+
+@_reads_from_replica
+def get_similar_term_names(name: str, limit: int = DEFAULT_SIMILAR_NAMES) -> List[str]:
+    """Get the term names one typo away from name, closest first, from memory."""
+    return _get_name_index(term_fuzzy_index).similar(name, limit=limit)
+
+
+@_reads_from_replica
+def get_term_names_by_normalized_name(name: str) -> List[str]:
+    """Get the term names that only differ from name in case or unicode width, ex. 'WMCS' for 'wmcs'.
+
+    The terms created by workers still running the code from before the
+    normalized names were added have none, those are matched by their lower
+    case name instead, that only ignores the case.
+    """
+    normalized_name = normalize_name(name)
+    query = (
+        db.session.query(Term.name)
+        .filter(
+            or_(
+                Term.normalized_name == normalized_name,
+                and_(Term.normalized_name.is_(None), func.lower(Term.name) == normalized_name),
+            )
+        )
+        .order_by(Term.name)
+    )
+    return [term_name for (term_name,) in query]
+
+
+@_reads_from_replica
+def get_term_names_page(
+    after: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE, name_filter: Optional[str] = None
+) -> Tuple[List[str], Optional[str]]:
+    """Get a page of term names sorted by name, and the cursor for the next page if there's any.
+
+    Pages are keyed on the name, so the cost of a page does not depend on how
+    far in the listing it is.
+    """
+    if name_filter is not None:
+        names = _get_name_index(term_search_index).page(name_filter, after=after, limit=limit + 1)
+    else:
+        query = db.session.query(Term.name)
+        if after is not None:
+            query = query.filter(Term.name > after)
+        names = [name for (name,) in query.order_by(Term.name).limit(limit + 1)]
 
+    if len(names) > limit:
+        return names[:limit], names[limit - 1]
 
+    return names, None
+
+
+@_reads_from_replica
+def count_terms(name_filter: Optional[str] = None) -> int:
+    """Approximate number of terms, taken from the name indexes instead of a full table count.
+
+    The total of the whole glossary comes from the prefix index, a fraction of
+    the size of the search index to load.
+    """
+    if name_filter is None:
+        return len(_get_name_index(term_prefix_index))
+
+    return _get_name_index(term_search_index).count(name_filter)
+
+
+@_reads_from_replica
+def get_definitions_page(
+    after: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE, author: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """Get a page of definitions sorted by id, and the cursor for the next page if there's any."""
+    query = serializers.select_definitions()
+    if after is not None:
+        query = query.filter(Definition.id > after)
+    if author is not None:
+        query = query.filter_by(author=author)
+
+    rows = db.session.execute(query.order_by(Definition.id).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+
+    with measure_serialization():
+        return [serializers.dump_definition(row) for row in rows], next_cursor
+
+
+@_reads_from_replica
+def get_changes_page(since: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """Get the settled changes after the since sequence number, oldest first.
+
+    Returns the changes, the sequence number to get the next ones from, and
+    whether there are more changes already.
+
+    The sequence numbers are given on insert, so a transaction can commit its
+    changes after the ones of a later transaction were read, and a consumer
+    syncing from the last one it saw would skip them for good. Only the
+    changes older than CHANGES_SETTLE_SECONDS are returned, and none after the
+    first that is not, leaving the transactions that long to commit.
+    """
+    settled_before = _get_changes_settled_before()
+    changes = db.session.query(Change).filter(Change.seq > since).order_by(Change.seq).limit(limit + 1).all()
+    has_more = len(changes) > limit
+    for index, change in enumerate(changes):
+        if change.created > settled_before:
+            changes, has_more = changes[:index], False
+            break
+    changes = changes[:limit]
+    change_schema = ChangeSchema(many=True)
+    with measure_serialization():
+        return change_schema.dump(changes), changes[-1].seq if changes else since, has_more
+
+
+def _get_changes_settled_before() -> datetime:
+    # the created timestamps are UTC, from the database clock, the settle
+    # time covers a small skew with the one of the workers too
+    settle_seconds = current_app.config.get("CHANGES_SETTLE_SECONDS", DEFAULT_CHANGES_SETTLE_SECONDS)
+    return datetime.utcnow() - timedelta(seconds=settle_seconds)
+
+
+@_reads_from_replica
+def get_last_change_seq() -> int:
+    """The last settled change, see get_changes_page, the ones after it are returned by the next syncs."""
+    return (
+        db.session.query(Change.seq)
+        .filter(Change.created <= _get_changes_settled_before())
+        .order_by(Change.seq.desc())
+        .limit(1)
+        .scalar()
+        or 0
+    )
+
+
+def get_changed_term_names(since: int) -> Tuple[Set[str], int]:
+    """Get the names of the terms changed after the since change, and the last change read."""
+    changed_names: Set[str] = set()
+    has_more = True
+    while has_more:
+        changes, since, has_more = get_changes_page(since=since, limit=MAX_PAGE_SIZE)
+        changed_names.update(change["term_name"] for change in changes)
+
+    return changed_names, since
+
+
+def iter_terms(chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Iterate over all the terms with their definitions, sorted by name.
+
+    The rows are streamed from a server side cursor chunk by chunk, loading
+    the definitions of each chunk with a single query, so memory usage does
+    not depend on the size of the glossary.
+    """
+    query = serializers.select_terms().execution_options(stream_results=True, max_row_buffer=chunk_size)
+    # the decorator would only cover creating the generator
+    with replica_reads(db.session):
+        yield from serializers.dump_terms(db.session.execute(query))
+
+
+def _make_etag(*parts: Any) -> str:
+    return hashlib.sha1(":".join(f"{part}" for part in parts).encode("utf-8")).hexdigest()
+
+
+def get_term_validator(term: Dict[str, Any]) -> Tuple[str, Optional[datetime]]:
+    """Get the etag and last modification time of the term dict being served.
+
+    Derived from the dict itself, as it can come from the cache or the compact
+    glossary of this worker, behind the writes of the others for a while: a
+    validator read from the database would pair the new version with the old
+    body, that the clients would then keep revalidating until the next write.
+    """
+    definitions = term["definitions"]
+    last_updated = max((datetime.fromisoformat(definition["updated"]) for definition in definitions), default=None)
+    return _make_etag(term["name"], definitions), last_updated
+
+
+def get_content_etag(content: Any) -> str:
+    """Get the etag of data served from the caches or the name indexes of this worker, computed from it.
+
+    For the same reason as the term validators, they can be behind the
+    database, so the glossary validator would not match them.
+    """
+    return _make_etag(content)
+
+
+@_reads_from_replica
+def get_glossary_validator() -> Tuple[str, Optional[datetime]]:
+    """Get the etag and last modification time of the whole glossary, for the listings read from the database.
+
+    From the last entry of the change log, with a single lookup by primary key,
+    as all the writes add one. The glossary written before the change log was
+    added has none, so no modification time.
+    """
+    last_change = db.session.query(Change.seq, Change.created).order_by(Change.seq.desc()).limit(1).first()
+    if last_change is None:
+        return _make_etag(0), None
+
+    return _make_etag(last_change.seq), last_change.created
+
+
+@_reads_from_replica
+def get_terms_by_name(names: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Get the terms with the given names that exist, by name, loading the ones not cached with a single query."""
+    if sticks_to_primary(db.session):
+        return _load_terms_by_name(list(names))
+
+    terms = {}
+    missing_names = []
+    for name in names:
+        is_fresh, term = _get_compact_term(name)
+        if is_fresh:
+            if term is not None:
+                terms[name] = term
+            continue
+
+        term = term_cache.get(name)
+        if term is None:
+            missing_names.append(name)
+        else:
+            terms[name] = term
+
+    if missing_names:
+        generations = {name: term_cache.get_generation(name) for name in missing_names}
+        for name, term in _load_terms_by_name(missing_names).items():
+            term_cache.set(name, term, generation=generations[name])
+            terms[name] = term
+
+    return terms
+
+
+@_reads_from_replica
+def explain_text(text: str) -> Dict[str, Any]:
+    """Find all the known terms in a text.
+
+    Returns the matches, with the start and end positions in the text and the
+    term name, and the matched terms with their definitions.
+    """
+    matches: List[Dict[str, Any]] = [
+        {"start": match.start, "end": match.end, "term": name}
+        for match in _get_name_index(term_matcher).find_all(text)
+        for name in match.names
+    ]
+    terms = get_terms_by_name({match["term"] for match in matches})
+    return {
+        "matches": [match for match in matches if match["term"] in terms],
+        "terms": terms,
+    }
+
+
+@_reads_from_replica
 def get_term(name: str) -> Dict[str, Any]:
-    term = db.session.query(Term).filter_by(name=name).one_or_none()
+    # the compact glossary and the cache hold what the replicas returned, and
+    # the flights might be reading from one, not what the user just wrote
+    if sticks_to_primary(db.session):
+        return _load_term(name=name)
+
+    is_fresh, term = _get_compact_term(name)
+    if is_fresh:
+        if term is None:
+            raise NotFound(f"Unable to find a term with name {name}.")
+
+        return term
+
+    term = term_cache.get(name)
+    if term is None:
+        term = term_flights.do(name, lambda: _load_into_cache(term_cache, name, lambda: _load_term(name=name)))
+
+    return term
+
+
+def _load_term(name: str) -> Dict[str, Any]:
+    term = _load_terms_by_name([name]).get(name)
     if not term:
         raise NotFound(f"Unable to find a term with name {name}.")
 
-    term_schema = TermSchema(many=False)
-    return term_schema.dump(term)
+    return term
 
 
+def _dump_definition(definition: Definition) -> Dict[str, Any]:
+    definition_schema = DefinitionSchema()
+    with measure_serialization():
+        return definition_schema.dump(definition)
+
+
+@_reads_from_replica
 def get_definition(id: int) -> Dict[str, Any]:
-    definition = db.session.query(Definition).filter_by(id=id).one_or_none()
-    if not definition:
+    if sticks_to_primary(db.session):
+        return _load_definition(id=id)
+
+    # ids come as strings from the urls
+    key = str(id)
+    definition = definition_cache.get(key)
+    if definition is None:
+        definition = definition_flights.do(
+            key, lambda: _load_into_cache(definition_cache, key, lambda: _load_definition(id=id))
+        )
+
+    return definition
+
+
+def _load_definition(id: int) -> Dict[str, Any]:
+    row = db.session.execute(serializers.select_definitions().filter(Definition.id == id)).one_or_none()
+    if not row:
         raise NotFound(f"Unable to find a definition with id {id}.")
 
-    definition_schema = DefinitionSchema()
-    return definition_schema.dump(definition)
+    with measure_serialization():
+        return serializers.dump_definition(row)
+
+
+def _create_term(new_term: Term) -> Dict[str, Any]:
+    """Commit the new term with its definitions, logging it and adding it to the caches and indexes."""
+    term_name = new_term.name
+    db.session.add(new_term)
+    try:
+        db.session.flush()
+    except IntegrityError as error:
+        db.session.rollback()
+        raise AlreadyExists(f"A term with name {term_name} already exists.") from error
+
+    term_schema = TermSchema(many=False)
+    with measure_serialization():
+        term = term_schema.dump(new_term)
+    # the definitions come with the term
+    _log_changes(("create", term_name, None))
+    db.session.commit()
+    _index_term_name(term_name)
+    _forget_term_lookups(term_name)
+    term_cache.set(term_name, term)
+    term_names_cache.clear()
+    return term
+
+
+def _log_changes(*changes: Tuple[str, str, Optional[int]]) -> None:
+    """Add (action, term name, definition id) entries to the change log, in the current transaction."""
+    db.session.execute(
+        insert(Change),
+        [
+            {"action": action, "term_name": term_name, "definition_id": definition_id}
+            for action, term_name, definition_id in changes
+        ],
+    )
 
 
 def set_definition(id: int, term_name: str, author: str, content: str) -> Dict[str, Any]:
-    definition = db.session.query(Definition).filter_by(id=id).one_or_none()
+    definition = db.session.get(Definition, id)
     if not definition:
         raise NotFound(f"Unable to find a definition with id {id}.")
 
-    if not db.session.query(Term).filter_by(name=term_name).one_or_none():
+    previous_term_name = definition.term_name
+    if term_name != previous_term_name and not db.session.get(Term, term_name):
         raise NotFound(f"Unable to find a term with name {term_name}.")
 
     definition.author = author
     definition.content = content
     definition.term_name = term_name
-    db.session.add(definition)
+    # flushing fetches the new update time, so the definition can be dumped
+    # without reloading it after the commit
+    db.session.flush()
+    definition_dict = _dump_definition(definition)
+    if term_name != previous_term_name:
+        _log_changes(("delete", previous_term_name, id), ("create", term_name, id))
+    else:
+        _log_changes(("update", term_name, id))
     db.session.commit()
-    definition = db.session.query(Definition).filter_by(id=id).one()
-    definition_schema = DefinitionSchema()
-    return definition_schema.dump(definition)
+    _invalidate_terms(previous_term_name, term_name)
+    _cache_definition(definition_dict)
+    render_definition(content)
+    return definition_dict
 
 
 def delete_definition(id: int) -> None:
-    definition = db.session.query(Definition).filter_by(id=id).one_or_none()
+    definition = db.session.get(Definition, id)
     if not definition:
         raise NotFound(f"Unable to find a definition with id {id}.")
 
+    term_name = definition.term_name
     db.session.delete(definition)
+    _log_changes(("delete", term_name, id))
     db.session.commit()
+    _invalidate_terms(term_name)
+    _invalidate_definition(id)
 
 
 def add_term(term_name: str) -> Optional[Dict[str, Any]]:
-    new_term = Term(name=term_name)
-    db.session.add(new_term)
-    return get_term(name=term_name)
+    return _create_term(Term(name=term_name, definitions=[]))
+
+
+def create_term_with_definition(term_name: str, author: str, content: str) -> Dict[str, Any]:
+    """Create a term with its first definition, in a single transaction.
+
+    Raises AlreadyExists if the term exists, in which case nothing is created.
+    """
+    term = _create_term(Term(name=term_name, definitions=[Definition(author=author, content=content)]))
+    render_definition(content)
+    return term
 
 
 def update_definition_for_term(
     term_name: str, definition_id: int, author: str, content: str
 ) -> Optional[Dict[str, Any]]:
-    if not db.session.query(Term).filter_by(name=term_name).one_or_none():
-        raise NotFound(f"Unable to find a term with name {term_name}.")
-
-    current_definition = db.session.query(Definition).filter_by(id=definition_id).one_or_none()
+    current_definition = db.session.get(Definition, definition_id)
     if not current_definition:
         raise NotFound(f"Unable to find a a definiton with id {definition_id}.")
 
-    if current_definition.author != author:
-        raise Unauthorized(f"Author {author} is not the author of the definition {definition_id}.")
-
     if current_definition.term_name != term_name:
+        if not db.session.get(Term, term_name):
+            raise NotFound(f"Unable to find a term with name {term_name}.")
+
         raise Unauthorized(
             f"Term {term_name} is not the term of the definition {definition_id} ({current_definition.term_name})."
         )
 
+    if current_definition.author != author:
+        raise Unauthorized(f"Author {author} is not the author of the definition {definition_id}.")
+
     current_definition.content = content
-    db.session.add(current_definition)
-    # needed to generate the id
+    db.session.flush()
+    definition = _dump_definition(current_definition)
+    _log_changes(("update", term_name, definition_id))
     db.session.commit()
-    return get_definition(id=current_definition.id)
+    _invalidate_terms(term_name)
+    _cache_definition(definition)
+    render_definition(content)
+    return definition
 
 
 def add_definition_to_term(term_name: str, author: str, content: str) -> Optional[Dict[str, Any]]:
-    if not db.session.query(Term).filter_by(name=term_name).one_or_none():
+    if not db.session.get(Term, term_name):
         raise NotFound(f"Unable to find a term with name {term_name}.")
 
     new_definition = Definition(term_name=term_name, author=author, content=content)
     db.session.add(new_definition)
     # needed to generate the id
+    db.session.flush()
+    definition = _dump_definition(new_definition)
+    _log_changes(("create", term_name, definition["id"]))
     db.session.commit()
-    return get_definition(id=new_definition.id)
+    _invalidate_terms(term_name)
+    _cache_definition(definition)
+    render_definition(content)
+    return definition
+
+
+def _validate_field(value: Any, field_name: str, max_length: int) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise InvalidRow(f"Missing {field_name}.")
+
+    if len(value) > max_length:
+        raise InvalidRow(f"The {field_name} is longer than {max_length} characters.")
+
+    return value
+
+
+def _validate_row(row: Any, author: Optional[str]) -> Tuple[str, List[Tuple[str, str]]]:
+    if isinstance(row, Exception):
+        raise InvalidRow(f"{row}")
+
+    if not isinstance(row, dict):
+        raise InvalidRow("The row must be an object with the term name and definitions.")
+
+    term_name = _validate_field(row.get("name"), "name", Term.__table__.c.name.type.length)
+    definitions = row.get("definitions") or []
+    if not isinstance(definitions, list):
+        raise InvalidRow("The definitions must be a list.")
+
+    validated_definitions = []
+    for definition in definitions:
+        if not isinstance(definition, dict):
+            raise InvalidRow("Each definition must be an object with author and content.")
+
+        validated_definitions.append(
+            (
+                _validate_field(
+                    author or definition.get("author"), "author", Definition.__table__.c.author.type.length
+                ),
+                _validate_field(definition.get("content"), "content", Definition.__table__.c.content.type.length),
+            )
+        )
+
+    return term_name, validated_definitions
+
+
+def _import_chunk(
+    rows: List[Tuple[int, str, List[Tuple[str, str]]]],
+    on_duplicate: str,
+    imported_names: Set[str],
+    report: Dict[str, Any],
+) -> None:
+    names = {term_name for _, term_name, _ in rows}
+    existing_names = {name for (name,) in db.session.query(Term.name).filter(Term.name.in_(names))}
+    existing_definitions = set(
+        db.session.query(Definition.term_name, Definition.author, Definition.content).filter(
+            Definition.term_name.in_(existing_names)
+        )
+    )
+
+    new_terms: List[Dict[str, str]] = []
+    new_definitions: List[Dict[str, str]] = []
+    skipped = 0
+    for _, term_name, definitions in rows:
+        # terms created earlier in this same import always get merged
+        if term_name in existing_names and term_name not in imported_names and on_duplicate == "skip":
+            skipped += 1
+            continue
+
+        if term_name not in existing_names:
+            new_terms.append({"name": term_name})
+            existing_names.add(term_name)
+            imported_names.add(term_name)
+
+        for author, content in definitions:
+            if (term_name, author, content) in existing_definitions:
+                continue
+
+            existing_definitions.add((term_name, author, content))
+            new_definitions.append({"term_name": term_name, "author": author, "content": content})
+
+    try:
+        if new_terms:
+            db.session.execute(insert(Term), new_terms)
+        if new_definitions:
+            db.session.execute(insert(Definition), new_definitions)
+        # the bulk inserts don't return the definition ids, the existing terms
+        # that got new definitions are logged as updated instead
+        new_names = {new_term["name"] for new_term in new_terms}
+        updated_names = {new_definition["term_name"] for new_definition in new_definitions} - new_names
+        if new_names or updated_names:
+            _log_changes(
+                *[("create", name, None) for name in sorted(new_names)],
+                *[("update", name, None) for name in sorted(updated_names)],
+            )
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        imported_names.difference_update(new_term["name"] for new_term in new_terms)
+        report["errors"].extend(
+            {"row": row_number, "error": f"Failed to store the row: {error}"} for row_number, _, _ in rows
+        )
+        return
+
+    for new_term in new_terms:
+        _index_term_name(new_term["name"])
+    _forget_term_lookups(*[new_term["name"] for new_term in new_terms])
+    _invalidate_terms(*{new_definition["term_name"] for new_definition in new_definitions})
+    if new_terms:
+        term_names_cache.clear()
+
+    report["terms_created"] += len(new_terms)
+    report["definitions_created"] += len(new_definitions)
+    report["skipped"] += skipped
+
+
+def import_terms(
+    rows: Iterable[Any],
+    on_duplicate: str = "skip",
+    author: Optional[str] = None,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> Dict[str, Any]:
+    """Import terms in bulk, in the same format as iter_terms yields them.
+
+    Rows are validated in memory and stored with bulk inserts, one transaction
+    per chunk. Terms that already exist are skipped, or with on_duplicate set
+    to 'merge' get the new definitions added, definitions with the same
+    author and content are never duplicated. If author is passed, it's used
+    for all the definitions instead of the ones in the rows.
+
+    Returns a report with the number of terms and definitions created, the
+    rows skipped, and the errors found, each with its row number.
+    """
+    if on_duplicate not in IMPORT_DUPLICATE_ACTIONS:
+        raise ValueError(f"Unknown on_duplicate action {on_duplicate}, known: {', '.join(IMPORT_DUPLICATE_ACTIONS)}")
+
+    report: Dict[str, Any] = {"terms_created": 0, "definitions_created": 0, "skipped": 0, "errors": []}
+    imported_names: Set[str] = set()
+    chunk: List[Tuple[int, str, List[Tuple[str, str]]]] = []
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            term_name, definitions = _validate_row(row=row, author=author)
+        except InvalidRow as error:
+            report["errors"].append({"row": row_number, "error": f"{error}"})
+            continue
+
+        chunk.append((row_number, term_name, definitions))
+        if len(chunk) >= chunk_size:
+            _import_chunk(rows=chunk, on_duplicate=on_duplicate, imported_names=imported_names, report=report)
+            chunk = []
+
+    if chunk:
+        _import_chunk(rows=chunk, on_duplicate=on_duplicate, imported_names=imported_names, report=report)
+
+    return report
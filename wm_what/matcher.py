@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Aho-Corasick automaton over the term names, to find all the known terms in a text.
+"""
+import threading
+from collections import deque
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple, cast
+
+from wm_what.indexes import NameIndex
+
+
+class Match(NamedTuple):
+    start: int
+    end: int
+    names: List[str]
+
+
+def _fold_char(char: str) -> str:
+    lower = char.lower()
+    return lower if len(lower) == 1 else char
+
+
+def _fold(text: str) -> str:
+    # lowercase keeping the length, so positions in the folded text match the original
+    return "".join(map(_fold_char, text))
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class _Automaton(NamedTuple):
+    goto: List[Dict[str, int]]
+    fail: List[int]
+    # (length, original names) of the names ending at each node, including
+    # the ones reached through the fail links
+    output: List[List[Tuple[int, Tuple[str, ...]]]]
+
+
+def _build(names: Dict[str, FrozenSet[str]]) -> _Automaton:
+    goto: List[Dict[str, int]] = [{}]
+    output: List[List[Tuple[int, Tuple[str, ...]]]] = [[]]
+    for folded, original_names in names.items():
+        node = 0
+        for char in folded:
+            next_node = goto[node].get(char)
+            if next_node is None:
+                next_node = len(goto)
+                goto[node][char] = next_node
+                goto.append({})
+                output.append([])
+            node = next_node
+        output[node].append((len(folded), tuple(sorted(original_names))))
+
+    # breadth first, so the fail links of the shallower nodes are ready when needed
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for char, child in goto[node].items():
+            queue.append(child)
+            fallback = fail[node]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[child] = goto[fallback].get(char, 0)
+            output[child] = output[child] + output[fail[child]]
+
+    return _Automaton(goto=goto, fail=fail, output=output)
+
+
+class TermMatcher(NameIndex):
+    """Case insensitive matcher of all the term names at once.
+
+    Matching is linear on the length of the text, whatever the number of terms.
+    Adding or removing names updates the name set, and the automaton is
+    rebuilt on the next match, as writes are rare compared to reads. The
+    rebuild is linear on the total length of the names (about half a second
+    for 100k terms), so it runs outside of the index lock, in a single
+    thread, while the others keep matching with the previous automaton, and
+    only the very first match waits for it.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        # folded name -> original names, replaced instead of updated so the
+        # builds can work on a shallow copy
+        self._names: Dict[str, FrozenSet[str]] = {}
+        # bumped on every change of the names
+        self._version = 0
+        self._automaton: Optional[_Automaton] = None
+        self._automaton_version = -1
+        self._build_lock = threading.Lock()
+
+    def _clear(self) -> None:
+        self._names = {}
+        self._version += 1
+
+    def _add(self, name: str) -> None:
+        folded = _fold(name)
+        self._names[folded] = self._names.get(folded, frozenset()) | {name}
+        self._version += 1
+
+    def _get_automaton(self) -> _Automaton:
+        automaton = self._automaton
+        if automaton is not None and self._automaton_version == self._version:
+            return automaton
+
+        if not self._build_lock.acquire(blocking=automaton is None):
+            # another thread is rebuilding it, keep matching with the previous one meanwhile
+            return cast(_Automaton, automaton)
+
+        try:
+            with self._lock:
+                version = self._version
+                names = dict(self._names)
+            # it might have been rebuilt while waiting for the build lock
+            if self._automaton is None or self._automaton_version != version:
+                self._automaton, self._automaton_version = _build(names), version
+
+            return self._automaton
+        finally:
+            self._build_lock.release()
+
+    def find_all(self, text: str) -> List[Match]:
+        """Return all the occurrences of known terms that are whole words in the text, by position."""
+        goto, fail, output = self._get_automaton()
+
+        folded_text = _fold(text)
+        matches = []
+        node = 0
+        for position, char in enumerate(folded_text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, names in output[node]:
+                start = position - length + 1
+                end = position + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if end < len(text) and _is_word_char(text[end]):
+                    continue
+                matches.append(Match(start=start, end=end, names=list(names)))
+
+        matches.sort(key=lambda match: (match.start, -match.end))
+        return matches
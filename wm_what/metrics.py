@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Per request performance metrics, exported in Prometheus text format.
+
+For every request it records the latency, the number and time of the SQL
+statements run (through SQLAlchemy engine events), the template rendering
+time and the serialization time, and logs a breakdown of the requests
+slower than SLOW_REQUEST_SECONDS.
+
+The metrics are kept in memory, per process, so each worker exports its own.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import flask
+import jinja2
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_SLOW_REQUEST_SECONDS = 1.0
+# statements kept per request for the slow request log
+MAX_LOGGED_STATEMENTS = 50
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    escaped = ((name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for name, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> (count per bucket, plus the +Inf one, and the sum)
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = labels + (("le", "+Inf" if bucket == float("inf") else f"{bucket}"),)
+                yield f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class CallbackMetric:
+    """Metric whose values are collected when exporting, ex. from counters kept elsewhere."""
+
+    def __init__(
+        self, name: str, description: str, metric_type: str, get_values: Callable[[], Dict[Labels, float]]
+    ) -> None:
+        self.name = name
+        self.description = description
+        self.metric_type = metric_type
+        self.get_values = get_values
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.metric_type}"
+        for labels, value in self.get_values().items():
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+REQUESTS = Counter("wm_what_requests_total", "Requests handled, by endpoint, method and status.")
+REQUEST_DURATION = Histogram(
+    "wm_what_request_duration_seconds", "Time to handle a request, by endpoint.", LATENCY_BUCKETS
+)
+SQL_STATEMENTS = Histogram(
+    "wm_what_request_sql_statements", "SQL statements run per request, by endpoint.", COUNT_BUCKETS
+)
+SQL_DURATION = Histogram(
+    "wm_what_request_sql_duration_seconds", "Time spent running SQL per request, by endpoint.", LATENCY_BUCKETS
+)
+TEMPLATE_DURATION = Histogram(
+    "wm_what_request_template_duration_seconds",
+    "Time spent rendering templates per request, by endpoint.",
+    LATENCY_BUCKETS,
+)
+SERIALIZATION_DURATION = Histogram(
+    "wm_what_request_serialization_duration_seconds",
+    "Time spent serializing db objects per request, by endpoint.",
+    LATENCY_BUCKETS,
+)
+METRICS: List[Union[Counter, Histogram, CallbackMetric]] = [
+    REQUESTS,
+    REQUEST_DURATION,
+    SQL_STATEMENTS,
+    SQL_DURATION,
+    TEMPLATE_DURATION,
+    SERIALIZATION_DURATION,
+]
+
+
+def register(metric: Union[Counter, Histogram, CallbackMetric]) -> None:
+    METRICS.append(metric)
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements: List[Tuple[float, str]] = []
+        self.template_time = 0.0
+        self.serialization_time = 0.0
+
+
+def _get_request_stats() -> Optional[RequestStats]:
+    if not flask.has_request_context():
+        return None
+
+    return flask.g.get("_request_stats")
+
+
+@contextmanager
+def measure_serialization() -> Iterator[None]:
+    """Account the time spent in the block as serialization time for the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _get_request_stats()
+        if stats is not None:
+            stats.serialization_time += time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    duration = time.perf_counter() - conn.info["_query_start"].pop()
+    stats = _get_request_stats()
+    if stats is None:
+        return
+
+    stats.sql_count += 1
+    stats.sql_time += duration
+    if len(stats.statements) < MAX_LOGGED_STATEMENTS:
+        stats.statements.append((duration, statement))
+
+
+def _handle_error(exception_context) -> None:
+    # after_cursor_execute is not called for failed statements
+    if exception_context.connection is not None:
+        query_starts = exception_context.connection.info.get("_query_start")
+        if query_starts:
+            query_starts.pop()
+
+
+class MeasuredTemplate(jinja2.Template):
+    """Template accounting its rendering time to the current request."""
+
+    def render(self, *args, **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats = _get_request_stats()
+            if stats is not None:
+                stats.template_time += time.perf_counter() - start
+
+
+def _start_request() -> None:
+    flask.g._request_stats = RequestStats()
+
+
+def _record_request(response: flask.Response) -> flask.Response:
+    stats = _get_request_stats()
+    if stats is None:
+        return response
+
+    duration = time.perf_counter() - stats.start
+    endpoint = flask.request.endpoint or "unknown"
+    REQUESTS.inc(endpoint=endpoint, method=flask.request.method, status=f"{response.status_code}")
+    REQUEST_DURATION.observe(duration, endpoint=endpoint)
+    SQL_STATEMENTS.observe(stats.sql_count, endpoint=endpoint)
+    SQL_DURATION.observe(stats.sql_time, endpoint=endpoint)
+    TEMPLATE_DURATION.observe(stats.template_time, endpoint=endpoint)
+    SERIALIZATION_DURATION.observe(stats.serialization_time, endpoint=endpoint)
+
+    if duration >= flask.current_app.config.get("SLOW_REQUEST_SECONDS", DEFAULT_SLOW_REQUEST_SECONDS):
+        statement_lines = [
+            f"\n  {statement_duration * 1000:.1f}ms {' '.join(statement.split())}"
+            for statement_duration, statement in sorted(stats.statements, reverse=True)
+        ]
+        flask.current_app.logger.warning(
+            f"Slow request {flask.request.method} {flask.request.full_path.rstrip('?')} ({endpoint}): "
+            f"{duration * 1000:.1f}ms total, {stats.sql_count} SQL statements in {stats.sql_time * 1000:.1f}ms, "
+            f"templates {stats.template_time * 1000:.1f}ms, serialization {stats.serialization_time * 1000:.1f}ms"
+            + "".join(statement_lines)
+        )
+
+    return response
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view() -> flask.Response:
+    return flask.Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app: Flask) -> None:
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+    app.jinja_env.template_class = MeasuredTemplate
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", endpoint="metrics", view_func=metrics_view)
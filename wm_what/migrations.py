@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Schema migrations that can be applied to a live database.
+
+Each migration is applied once, in order, and recorded in the
+schema_migrations table. They are written to be safe to re-run (they check
+for what they add before adding it), and to not block the running app: on
+MySQL the indexes and columns are added in place without locking the table,
+and the backfills update the rows in small batches, each in its own
+transaction. They are applied while the previous version of the app keeps
+serving, before restarting it with the code that uses the new columns, see
+utils/deploy_toolforge.sh.
+
+A new database gets the full schema from db.create_all() and is stamped with
+all the migrations instead, see utils/setup_db.py. Apply them with
+utils/migrate_db.py.
+"""
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, DropIndex
+
+from wm_what.models import Change, Definition, Term, normalize_name
+
+BACKFILL_BATCH_SIZE = 1000
+
+metadata = sa.MetaData()
+migrations_table = sa.Table(
+    "schema_migrations",
+    metadata,
+    sa.Column("name", sa.String(80), primary_key=True),
+    sa.Column("applied", sa.TIMESTAMP, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    name: str
+    description: str
+    apply: Callable[[Engine], None]
+
+
+def _online(engine: Engine, statement: str, mysql_options: str) -> str:
+    # MySQL would otherwise copy the table, blocking the writes to it meanwhile
+    if engine.dialect.name == "mysql":
+        return f"{statement} {mysql_options}"
+
+    return statement
+
+
+def _add_index(table: sa.Table, index_name: str) -> Callable[[Engine], None]:
+    def _apply(engine: Engine) -> None:
+        if index_name in {index["name"] for index in sa.inspect(engine).get_indexes(table.name)}:
+            return
+
+        (index,) = [index for index in table.indexes if index.name == index_name]
+        statement = f"{CreateIndex(index).compile(dialect=engine.dialect)}"
+        with engine.begin() as conn:
+            conn.execute(sa.text(_online(engine, statement, mysql_options="ALGORITHM=INPLACE LOCK=NONE")))
+
+    return _apply
+
+
+def _drop_index(table: sa.Table, index_name: str) -> Callable[[Engine], None]:
+    def _apply(engine: Engine) -> None:
+        # the index is no longer in the models, reflected from the database
+        reflected = sa.Table(table.name, sa.MetaData(), autoload_with=engine)
+        indexes = [index for index in reflected.indexes if index.name == index_name]
+        if not indexes:
+            return
+
+        statement = f"{DropIndex(indexes[0]).compile(dialect=engine.dialect)}"
+        with engine.begin() as conn:
+            conn.execute(sa.text(_online(engine, statement, mysql_options="ALGORITHM=INPLACE LOCK=NONE")))
+
+    return _apply
+
+
+def _skip(engine: Engine) -> None:
+    pass
+
+
+def _add_column(table: sa.Table, column_name: str) -> Callable[[Engine], None]:
+    def _apply(engine: Engine) -> None:
+        if column_name in {column["name"] for column in sa.inspect(engine).get_columns(table.name)}:
+            return
+
+        column = table.c[column_name]
+        preparer = engine.dialect.identifier_preparer
+        statement = (
+            f"ALTER TABLE {preparer.format_table(table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}"
+        )
+        with engine.begin() as conn:
+            conn.execute(sa.text(_online(engine, statement, mysql_options=", ALGORITHM=INPLACE, LOCK=NONE")))
+
+    return _apply
+
+
+def _backfill_normalized_names(engine: Engine, batch_size: int = BACKFILL_BATCH_SIZE) -> None:
+    term = Term.__table__
+    update = (
+        term.update()
+        .where(term.c.name == sa.bindparam("term_name"))
+        .values(normalized_name=sa.bindparam("normalized_name"))
+    )
+    # loops until no row is missing it, that also covers the terms created
+    # meanwhile by workers still running the previous code
+    while True:
+        with engine.begin() as conn:
+            names = conn.execute(
+                sa.select(term.c.name).where(term.c.normalized_name.is_(None)).limit(batch_size)
+            ).scalars()
+            rows = [{"term_name": name, "normalized_name": normalize_name(name)} for name in names]
+            if not rows:
+                return
+
+            conn.execute(update, rows)
+
+
+def _create_table(table: sa.Table) -> Callable[[Engine], None]:
+    def _apply(engine: Engine) -> None:
+        table.create(engine, checkfirst=True)
+
+    return _apply
+
+
+def _add_normalized_names(engine: Engine) -> None:
+    _add_column(Term.__table__, "normalized_name")(engine)
+    _backfill_normalized_names(engine)
+    _add_index(Term.__table__, "ix_term_normalized_name")(engine)
+
+
+# in the order they are applied, never rename or reorder the applied ones
+MIGRATIONS = (
+    Migration(
+        name="0001_definition_term_name_index",
+        description="Index the definitions by term, to load the definitions of a term without a table scan.",
+        apply=_add_index(Definition.__table__, "ix_definition_term_name"),
+    ),
+    Migration(
+        name="0002_definition_author_index",
+        description="Index the definitions by author, for the listings of the definitions of a user.",
+        apply=_add_index(Definition.__table__, "ix_definition_author"),
+    ),
+    Migration(
+        name="0003_term_normalized_name",
+        description="Add the case insensitive term names, filled for the existing terms, and index them.",
+        apply=_add_normalized_names,
+    ),
+    Migration(
+        name="0004_change_log",
+        description="Add the log of the changes, for the incremental syncs, it starts empty.",
+        apply=_create_table(Change.__table__),
+    ),
+    Migration(
+        name="0005_change_term_name_index",
+        description="Index the change log by term, for the last change of a term in its etag.",
+        # the index is dropped by the next one, the etags of the terms no longer read the change log
+        apply=_skip,
+    ),
+    Migration(
+        name="0006_drop_change_term_name_index",
+        description="Drop the index of the change log by term, the etags of the terms are computed from the terms.",
+        apply=_drop_index(Change.__table__, "ix_change_term_name"),
+    ),
+)
+
+
+def get_applied(engine: Engine) -> Dict[str, datetime]:
+    """Return when each of the applied migrations was applied, by name."""
+    migrations_table.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return dict(conn.execute(sa.select(migrations_table.c.name, migrations_table.c.applied)).all())
+
+
+def get_pending(engine: Engine) -> List[Migration]:
+    applied = get_applied(engine)
+    return [migration for migration in MIGRATIONS if migration.name not in applied]
+
+
+def _record(engine: Engine, migration: Migration) -> None:
+    with engine.begin() as conn:
+        conn.execute(migrations_table.insert().values(name=migration.name, applied=datetime.utcnow()))
+
+
+def apply_pending(engine: Engine, log: Callable[[str], None] = print) -> List[Migration]:
+    """Apply the migrations not applied yet, in order, and return them."""
+    pending = get_pending(engine)
+    for migration in pending:
+        log(f"Applying {migration.name}: {migration.description}")
+        migration.apply(engine)
+        _record(engine, migration)
+
+    return pending
+
+
+def stamp_all(engine: Engine) -> None:
+    """Record all the migrations as applied, for databases created with the current schema."""
+    for migration in get_pending(engine):
+        _record(engine, migration)
@@ -1,29 +1,65 @@
+import unicodedata
+
 from flask_login.mixins import UserMixin
 from flask_marshmallow import Marshmallow  # type: ignore
-from flask_sqlalchemy import SQLAlchemy  # type: ignore
 from marshmallow import fields
 
-db = SQLAlchemy()
+from wm_what.routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 ma = Marshmallow()
 
 
+def normalize_name(name: str) -> str:
+    """Case and width insensitive form of a term name, for lookups."""
+    return unicodedata.normalize("NFKC", name).casefold()
+
+
+def _get_normalized_name(context) -> str:
+    return normalize_name(context.get_current_parameters()["name"])
+
+
 class Definition(db.Model):
     __tablename__ = "definition"
     id = db.Column(db.Integer, primary_key=True)
-    author = db.Column(db.String(80), unique=False, nullable=False)
+    author = db.Column(db.String(80), unique=False, nullable=False, index=True)
     content = db.Column(db.String(256), unique=False, nullable=False)
     created = db.Column(db.TIMESTAMP, nullable=False, server_default=db.func.now())
     updated = db.Column(db.TIMESTAMP, nullable=False, server_default=db.func.now(), onupdate=db.func.now())
-    term_name = db.Column(db.String(80), db.ForeignKey("term.name"))
+    term_name = db.Column(db.String(80), db.ForeignKey("term.name"), index=True)
     term = db.relationship("Term", back_populates="definitions")
 
+    # fetch the server generated timestamps when flushing (with RETURNING where
+    # supported), instead of on the first access after the commit
+    __mapper_args__ = {"eager_defaults": True}
+
 
 class Term(db.Model):
     __tablename__ = "term"
     name = db.Column(db.String(80), primary_key=True)
+    # nullable as it was added to existing databases, see migrations.py, and
+    # longer than the name as normalizing can expand some characters
+    normalized_name = db.Column(db.String(255), nullable=True, index=True, default=_get_normalized_name)
     definitions = db.relationship("Definition", back_populates="term")
 
 
+class Change(db.Model):
+    """Append-only log of the changes to the glossary, written in the same transaction as them.
+
+    A change refers to a term, and to one of its definitions when only that
+    definition changed, consumers are expected to fetch the current state of
+    what changed.
+    """
+
+    __tablename__ = "change"
+    # monotonic, consumers sync from the last one they saw
+    seq = db.Column(db.Integer, primary_key=True)
+    created = db.Column(db.TIMESTAMP, nullable=False, server_default=db.func.now())
+    action = db.Column(db.String(16), nullable=False)
+    term_name = db.Column(db.String(80), nullable=False)
+    definition_id = db.Column(db.Integer, nullable=True)
+
+
 # We don't need to persist this, comes from oauth
 class User(UserMixin):
     def __init__(self, username: str):
@@ -43,5 +79,11 @@ class TermSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Term
         include_fk = True
+        exclude = ("normalized_name",)
 
     definitions = fields.List(fields.Nested(DefinitionSchema, exclude=["term_name"]))
+
+
+class ChangeSchema(ma.SQLAlchemyAutoSchema):
+    class Meta:
+        model = Change
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Files and folders set in the config.
+"""
+from pathlib import Path
+from typing import Optional
+
+from flask import Flask
+
+
+def get_config_path(app: Flask, key: str) -> Optional[Path]:
+    """The path set in the app config under key, None if it's not set.
+
+    Relative paths are relative to the wm_what folder, not to the one the app
+    is started from.
+    """
+    path = app.config.get(key)
+    if not path:
+        return None
+
+    return Path(app.root_path) / path
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Routing of the reads to the replicas of the database.
+
+The replicas are extra SQLALCHEMY_BINDS, listed by name in REPLICA_BINDS.
+The queries run inside replica_reads() go to one of them, picked at random
+once per session, unless the session wrote to the primary already or the
+user wrote in the last REPLICA_STICKY_SECONDS (tracked in the flask session,
+so the user that just edited a definition sees it even if the replicas lag
+behind). Everything else, including all the writes, goes to the primary.
+Without REPLICA_BINDS everything goes to the primary. The worker-wide
+caches in wm_what.lib hold what the replicas returned, so they are skipped
+too by the sessions sticking to the primary, see sticks_to_primary().
+
+SQLALCHEMY_BIND_ENGINE_OPTIONS sets the engine options (ex. pool_size,
+pool_timeout) per bind, with the PRIMARY_BIND key for the primary, on top
+of SQLALCHEMY_ENGINE_OPTIONS.
+"""
+import contextlib
+import random
+import time
+from typing import Any, Iterator, Optional, Union
+
+import flask
+
+# the session and engine connector classes of flask-sqlalchemy 2.x, pinned in setup.py
+from flask_sqlalchemy import _EngineConnector  # type: ignore
+from flask_sqlalchemy import SignallingSession, SQLAlchemy  # type: ignore
+from sqlalchemy import orm
+from sqlalchemy.engine import Engine
+
+PRIMARY_BIND = "primary"
+# seconds, longer than the usual replication lag
+DEFAULT_REPLICA_STICKY_SECONDS = 10
+
+# keys in the session info
+_REPLICA_READS = "wm_what_replica_reads"
+_REPLICA_BIND = "wm_what_replica_bind"
+_PRIMARY_ONLY = "wm_what_primary_only"
+# key in the flask session
+_LAST_WRITE = "wm_what_last_write"
+
+
+class _BindEngineConnector(_EngineConnector):
+    def get_options(self, sa_url, echo):
+        sa_url, options = super().get_options(sa_url, echo)
+        bind_options = self._app.config.get("SQLALCHEMY_BIND_ENGINE_OPTIONS") or {}
+        options.update(bind_options.get(self._bind or PRIMARY_BIND, {}))
+        return sa_url, options
+
+
+class RoutingSession(SignallingSession):
+    def _get_replica_bind(self) -> Optional[str]:
+        replica_binds = self.app.config.get("REPLICA_BINDS")
+        if not replica_binds or self.info.get(_PRIMARY_ONLY):
+            return None
+
+        if flask.has_request_context():
+            sticky_seconds = self.app.config.get("REPLICA_STICKY_SECONDS", DEFAULT_REPLICA_STICKY_SECONDS)
+            if time.time() - flask.session.get(_LAST_WRITE, 0) < sticky_seconds:
+                return None
+
+        if _REPLICA_BIND not in self.info:
+            self.info[_REPLICA_BIND] = random.choice(replica_binds)
+
+        return self.info[_REPLICA_BIND]
+
+    def sticks_to_primary(self) -> bool:
+        return bool(self.app.config.get("REPLICA_BINDS")) and self._get_replica_bind() is None
+
+    def _mark_write(self) -> None:
+        self.info[_PRIMARY_ONLY] = True
+        if flask.has_request_context():
+            flask.session[_LAST_WRITE] = time.time()
+
+    def get_bind(self, mapper=None, clause=None, **kwargs) -> Engine:
+        if self._flushing or getattr(clause, "is_dml", False):
+            self._mark_write()
+        elif self.info.get(_REPLICA_READS):
+            replica_bind = self._get_replica_bind()
+            if replica_bind is not None:
+                return self.app.extensions["sqlalchemy"].db.get_engine(self.app, bind=replica_bind)
+
+        return super().get_bind(mapper=mapper, clause=clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension with the per bind engine options and the replica aware session."""
+
+    def create_session(self, options: Any) -> orm.sessionmaker:
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def make_connector(self, app=None, bind=None) -> _EngineConnector:
+        return _BindEngineConnector(self, self.get_app(app), bind)
+
+
+@contextlib.contextmanager
+def replica_reads(session: orm.Session) -> Iterator[None]:
+    """Send the queries run inside to a replica, when configured and not sticking to the primary."""
+    previous = session.info.get(_REPLICA_READS, False)
+    session.info[_REPLICA_READS] = True
+    try:
+        yield
+    finally:
+        session.info[_REPLICA_READS] = previous
+
+
+def sticks_to_primary(session: Union[orm.Session, orm.scoped_session]) -> bool:
+    """Whether the reads of the session go to the primary while there are replicas, to see its own writes."""
+    if isinstance(session, orm.scoped_session):
+        session = session()
+
+    return isinstance(session, RoutingSession) and session.sticks_to_primary()
+
+
+def stick_to_primary(session: orm.Session) -> None:
+    """Send all the following queries of the session to the primary, ex. to read what was just written."""
+    session.info[_PRIMARY_ONLY] = True
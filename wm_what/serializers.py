@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Serialization of the terms and definitions from raw rows, for the hot reads.
+
+Builds the same dicts TermSchema and DefinitionSchema dump (same keys, in
+the same order, same timestamp format), from the tuples of Core selects,
+without loading ORM instances nor going through the generic per field dump
+of marshmallow. The schemas are still the reference, used for the writes and
+the api docs, benchmarks/check_serialization_parity.py checks both agree.
+"""
+import itertools
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+
+from wm_what.models import Definition, Term
+
+# in the order the schemas dump them
+DEFINITION_COLUMNS = (Definition.id, Definition.author, Definition.content, Definition.created, Definition.updated)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    # same as the marshmallow DateTime field default format
+    return value.isoformat() if value is not None else None
+
+
+def select_definitions() -> Select:
+    """The columns dump_definition expects, to add the filters and ordering to."""
+    return select(*DEFINITION_COLUMNS, Definition.term_name)
+
+
+def select_terms() -> Select:
+    """The columns dump_terms expects, ordered by term.
+
+    One row per definition, and a single one without definition for the terms that have none.
+    """
+    return (
+        select(Term.name, *DEFINITION_COLUMNS)
+        .select_from(Term)
+        .outerjoin(Definition, Definition.term_name == Term.name)
+        .order_by(Term.name, Definition.id)
+    )
+
+
+def dump_definition(row: Sequence[Any]) -> Dict[str, Any]:
+    """Same as DefinitionSchema().dump for a row of select_definitions."""
+    definition_id, author, content, created, updated, term_name = row
+    return {
+        "id": definition_id,
+        "author": author,
+        "content": content,
+        "created": _isoformat(created),
+        "updated": _isoformat(updated),
+        "term_name": term_name,
+    }
+
+
+def _dump_term_definitions(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": definition_id,
+            "author": author,
+            "content": content,
+            "created": _isoformat(created),
+            "updated": _isoformat(updated),
+        }
+        for _, definition_id, author, content, created, updated in rows
+        # the outer join row of a term without definitions
+        if definition_id is not None
+    ]
+
+
+def dump_terms(rows: Iterable[Sequence[Any]]) -> Iterator[Dict[str, Any]]:
+    """Same as TermSchema().dump for each term in the rows of select_terms, streaming them."""
+    for name, term_rows in itertools.groupby(rows, key=lambda row: row[0]):
+        yield {"definitions": _dump_term_definitions(term_rows), "name": name}
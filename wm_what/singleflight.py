@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Coalescing of the concurrent identical calls, used for the lib reads.
+
+When many threads of a worker miss the cache for the same key at once (ex.
+a term just linked in a busy channel), only the first one runs the query,
+the others wait for it and get the same result, or the same exception.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run a function once per key among the callers asking for it at the same time.
+
+    Keeps counters of the calls run and the ones that joined a running one.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                # it might have been forgotten, and a newer call started
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def forget(self, key: Hashable) -> None:
+        """Make the next callers run the function again, ex. after the data changed while it was running."""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requested = self.calls + self.coalesced
+            return {
+                "in_flight": len(self._calls),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "coalescing_rate": self.coalesced / requested if requested else 0.0,
+            }
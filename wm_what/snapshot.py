@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Static snapshot of the glossary, to serve the anonymous readers from a file server or a CDN.
+
+build() renders, as an anonymous user would get them, the splash page to
+index.html, each term page to term/<name>.html and each term of the api to
+api/v1/terms/<name>.json, and copies the static files and the fingerprinted
+assets next to them. The file server maps the urls of the app to them, ex.
+with nginx `try_files $uri $uri.html $uri.json @app;`, and sends the rest
+(search, logins, edits) to the app.
+
+The last change of the change log the snapshot includes is recorded in
+snapshot.json, the next builds only render again the terms changed after it,
+unless asked for a full build. Files are replaced atomically, so the file
+server never serves half written ones.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Set
+
+import flask
+from flask import Flask
+
+from wm_what import lib
+from wm_what.models import db
+from wm_what.paths import get_config_path
+from wm_what.routing import stick_to_primary
+
+SNAPSHOT_FILE_NAME = "snapshot.json"
+TERMS_FOLDER = Path("term")
+API_TERMS_FOLDER = Path("api") / "v1" / "terms"
+# terms loaded per query when rendering only the changed ones
+CHUNK_SIZE = 500
+
+
+def _is_safe_name(name: str) -> bool:
+    # names are used as file names, the app urls can not have them anyway
+    return name not in ("", ".", "..") and "/" not in name and "\0" not in name
+
+
+def _write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, delete=False, encoding="utf-8") as temp_file:
+        temp_file.write(content)
+    os.replace(temp_file.name, path)
+
+
+def _write_term(output_folder: Path, term: Dict[str, Any]) -> None:
+    name = term["name"]
+    # same as the views render them for anonymous users
+    _write(
+        output_folder / TERMS_FOLDER / f"{name}.html",
+        flask.render_template("term.html", term=term, has_definition=False, user=None),
+    )
+    _write(output_folder / API_TERMS_FOLDER / f"{name}.json", flask.jsonify(term).get_data(as_text=True))
+
+
+def _remove_term(output_folder: Path, name: str) -> bool:
+    page_path = output_folder / TERMS_FOLDER / f"{name}.html"
+    existed = page_path.is_file()
+    page_path.unlink(missing_ok=True)
+    (output_folder / API_TERMS_FOLDER / f"{name}.json").unlink(missing_ok=True)
+    return existed
+
+
+def _iter_terms_by_name(names: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    names = sorted(names)
+    for start in range(0, len(names), CHUNK_SIZE):
+        yield from lib.get_terms_by_name(names[start : start + CHUNK_SIZE]).values()
+
+
+def _get_snapshot_names(output_folder: Path) -> Set[str]:
+    return {path.stem for path in (output_folder / TERMS_FOLDER).glob("*.html")}
+
+
+def _copy_static_files(app: Flask, output_folder: Path) -> None:
+    # None when the app is created with static_folder=None
+    if app.static_folder:
+        shutil.copytree(app.static_folder, output_folder / "static", dirs_exist_ok=True)
+    assets_folder = get_config_path(app, "ASSETS_FOLDER")
+    if assets_folder is not None:
+        shutil.copytree(assets_folder, output_folder / "assets", dirs_exist_ok=True)
+
+
+def build(app: Flask, output_folder: Path, full: bool = False) -> Dict[str, Any]:
+    """Write or update the snapshot, return how many terms were rendered and removed."""
+    snapshot_path = output_folder / SNAPSHOT_FILE_NAME
+    previous = json.loads(snapshot_path.read_text()) if snapshot_path.is_file() and not full else None
+    report = {"full": previous is None, "terms_rendered": 0, "terms_removed": 0, "terms_skipped": 0}
+    with app.test_request_context():
+        # a replica could be behind the change log read
+        stick_to_primary(db.session)
+        # taken before reading the terms, the changes made while building are
+        # rendered again by the next one
+        last_change = lib.get_last_change_seq()
+        if previous is None:
+            stale_names = _get_snapshot_names(output_folder)
+            terms = lib.iter_terms()
+        else:
+            stale_names, _ = lib.get_changed_term_names(since=previous["last_change"])
+            terms = _iter_terms_by_name(stale_names)
+
+        for term in terms:
+            stale_names.discard(term["name"])
+            if not _is_safe_name(term["name"]):
+                report["terms_skipped"] += 1
+                continue
+
+            _write_term(output_folder=output_folder, term=term)
+            report["terms_rendered"] += 1
+
+        # the ones not found anymore
+        for name in stale_names:
+            if _is_safe_name(name) and _remove_term(output_folder=output_folder, name=name):
+                report["terms_removed"] += 1
+
+        _write(
+            output_folder / "index.html",
+            flask.render_template("splash.html", example_terms=lib.get_term_names(limit=25), user=None),
+        )
+
+    _copy_static_files(app=app, output_folder=output_folder)
+    _write(snapshot_path, json.dumps({"last_change": last_change, "built": time.time()}, indent=4))
+    report["last_change"] = last_change
+    return report
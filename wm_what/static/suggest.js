@@ -0,0 +1,44 @@
+// Autocomplete for the search boxes, fills their datalist with the term names
+// starting with what is being typed, from the suggest api.
+(function () {
+  "use strict";
+
+  var DELAY_MS = 100;
+
+  function setSuggestions(datalist, names) {
+    var options = names.map(function (name) {
+      var option = document.createElement("option");
+      option.value = name;
+      return option;
+    });
+    datalist.replaceChildren.apply(datalist, options);
+  }
+
+  document.querySelectorAll("input[data-suggest-url]").forEach(function (input) {
+    var datalist = document.getElementById(input.getAttribute("list"));
+    var timer = null;
+    var lastPrefix = null;
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        var prefix = input.value;
+        if (!prefix || prefix === lastPrefix) {
+          return;
+        }
+        lastPrefix = prefix;
+        fetch(input.dataset.suggestUrl + "?prefix=" + encodeURIComponent(prefix))
+          .then(function (response) {
+            return response.json();
+          })
+          .then(function (data) {
+            // ignore stale responses
+            if (input.value === prefix) {
+              setSuggestions(datalist, data.suggestions);
+            }
+          })
+          .catch(function () {});
+      }, DELAY_MS);
+    });
+  });
+})();